@@ -0,0 +1,114 @@
+#Checks that ending the terminal phase early (terminalParams) keeps the reward of the full phase: the same seeded
+#episodes are played with the full 1000 tick phase, with terminalParams and with terminalParams and stopOnSuccess.
+#The report has the number of terminal phases and successes, the rewards that differ from the full phase and the
+#average length of the terminal phase in ticks.
+#usage (from src):
+#  python -m benchmarks.earlyOutcome [--tasks grasp stackInHand] [--episodes 150] [--fast-reset]
+#the exit code is 1 if a reward with terminalParams differs from the full phase, a task raises, a task never reaches
+#its terminal phase or grasp or stackInHand never succeeds. A success lost with stopOnSuccess is reported only, a
+#lifted block may slip after the phase has stopped.
+import argparse
+import json
+import sys
+import numpy as np
+from benchmarks.envBench import TASKS, runTask
+
+VARIANTS = [
+    ('full', None),
+    ('early', {}),
+    ('stopOnSuccess', {'stopOnSuccess': True}),
+]
+
+#the block in hand does not reach block2 under step2 here, so a stack start known to succeed puts block1 on top of
+#block2 under the gripper of getGoodInitState. The first step down starts the release phase.
+def stackedStart(env):
+  env.getGoodInitState()
+  pos, orn = env._p.getBasePositionAndOrientation(env.block2Uid)
+  env._p.resetBasePositionAndOrientation(env.block1Uid, [pos[0], pos[1], pos[2]+0.05], orn)
+
+#tasks with a start of their own, which every fourth episode starts from
+STARTS = {'stackInHand': stackedStart}
+
+#tasks that have to succeed at least once, so that the success path and stopOnSuccess are covered
+SUCCEED = ('grasp', 'stackInHand')
+
+#reward and terminal phase ticks (0 without one) of every episode. The episodes start from reset,
+#getGoodInitState, getMidInitState and the task's own start, if it has one, in turn. step2 drives the end effector
+#to the object the observation is relative to with noise drawn from the episode's seed.
+def runEpisodes(env, numEpisodes, seed, start=None, maxSteps=12, speed=0.02, noise=0.02):
+  ticks = []
+  runPhase = env._runPhase
+  env._runPhase = lambda phase: ticks.append(runPhase(phase))
+  rewards = np.zeros(numEpisodes)
+  phaseTicks = np.zeros(numEpisodes, dtype=np.int64)
+  numStarts = 3 if start is None else 4
+  for ep in range(numEpisodes):
+    env.reset(seed=seed+ep)
+    if ep % numStarts == 1:
+      env.getGoodInitState()
+    elif ep % numStarts == 2:
+      env.getMidInitState()
+    elif ep % numStarts == 3:
+      start(env)
+    rng = np.random.default_rng(seed+ep)
+    del ticks[:]
+    for _ in range(maxSteps):
+      action = rng.uniform(-noise, noise, 7)
+      action[:3] += np.clip(np.subtract(env.getObjectPose()[0], env._kuka.endEffectorState[0]), -speed, speed)
+      _, reward, done, _ = env.step2(action)
+      if done:
+        break
+    rewards[ep] = reward
+    phaseTicks[ep] = sum(ticks)
+  return rewards, phaseTicks
+
+def compareTask(envCls, numEpisodes, seed, start=None, **kwargs):
+  runs = {}
+  for variant, terminalParams in VARIANTS:
+    env = envCls(terminalParams=terminalParams, **kwargs)
+    try:
+      runs[variant] = runEpisodes(env, numEpisodes, seed, start)
+    finally:
+      env.close()
+  rewards, phaseTicks = runs['full']
+  terminal = phaseTicks > 0
+  results = {'terminalPhases': int(terminal.sum()), 'successes': int((rewards > 0).sum())}
+  for variant, (variantRewards, variantTicks) in runs.items():
+    results[variant] = {
+        'successes': int((variantRewards > 0).sum()),
+        'rewardsDiffer': int((variantRewards != rewards).sum()),
+        'meanTicks': float(variantTicks[terminal].mean()) if terminal.any() else 0.,
+    }
+  return results
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Check that the early outcome of the terminal phase keeps the reward')
+  parser.add_argument('--tasks', nargs='+', default=list(TASKS), choices=list(TASKS))
+  parser.add_argument('--episodes', type=int, default=150)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--fast-reset', action='store_true')
+  args = parser.parse_args(argv)
+
+  failed = False
+  results = {}
+  for name in args.tasks:
+    results[name] = runTask(compareTask, TASKS[name], args.episodes, args.seed, STARTS.get(name), \
+            fastReset=args.fast_reset)
+    if 'skipped' in results[name] or 'error' in results[name]:
+      failed = failed or 'error' in results[name]
+      continue
+    if results[name]['early']['rewardsDiffer']:
+      print('REWARD %s: %d rewards differ from the full phase' % (name, results[name]['early']['rewardsDiffer']), \
+              file=sys.stderr)
+      failed = True
+    if not results[name]['terminalPhases']:
+      print('COVERAGE %s: no episode reached the terminal phase' % name, file=sys.stderr)
+      failed = True
+    if name in SUCCEED and not (results[name]['successes'] and results[name]['stopOnSuccess']['successes']):
+      print('COVERAGE %s: no success with the full phase or with stopOnSuccess' % name, file=sys.stderr)
+      failed = True
+  print(json.dumps(results, indent=2))
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,226 @@
+#Throughput, latency, physics step cost and memory of the task envs in DIRECT mode
+#usage (from src):
+#  python -m benchmarks.envBench --output results.json
+#  python -m benchmarks.envBench --save-baseline baseline.json
+#  python -m benchmarks.envBench --baseline baseline.json --tolerance 0.2
+#with --baseline the exit code is 1 if a metric got worse than the baseline by more than tolerance or a task of the
+#baseline did not run, a task that raises fails the run (see runTask)
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import sys
+import time
+import traceback
+import numpy as np
+import pybullet
+from kuka.kukaContiGraspEnv import KukaContiGraspEnv
+from kuka.kukaContiStackInHandEnv import KukaContiStackInHandEnv
+from kuka.kukaContiOpenDoorEnv import KukaContiOpenDoorEnv
+from kuka.assets import AssetRegistry, MissingAssetRootError
+
+TASKS = {
+    'grasp': KukaContiGraspEnv,
+    'stackInHand': KukaContiStackInHandEnv,
+    'openDoor': KukaContiOpenDoorEnv,
+}
+
+#result of fn(*args, **kwargs) for one task of a benchmark. A task without its asset root (openDoor without
+#URDF_DATA) gives {'skipped': why}, a task that raises prints the traceback and gives {'error': why}, which fails
+#the run.
+def runTask(fn, *args, **kwargs):
+  try:
+    return fn(*args, **kwargs)
+  except MissingAssetRootError as e:
+    return {'skipped': '%s: %s' % (type(e).__name__, e)}
+  except Exception as e:
+    traceback.print_exc()
+    return {'error': '%s: %s' % (type(e).__name__, e)}
+
+#metric: True if higher is better, False if lower is better, None if it should not change at all
+METRICS = {
+    'stepsPerSec': True,
+    'stepLatencyP50': False,
+    'stepLatencyP99': False,
+    'physicsStepsPerAction': None,
+    'resetsPerSec': True,
+    'physicsStepUs': False,
+    'memoryPerEnvMB': False,
+}
+
+def _rssBytes():
+  try:
+    with open('/proc/self/statm') as f:
+      return int(f.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+  except (IOError, OSError):
+    #peak instead of current resident size, in KB on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*scale
+
+def benchStep(env, stepFn, numSteps, rng):
+  latencies = np.zeros(numSteps)
+  physicsSteps = np.zeros(numSteps)
+  env.reset()
+  for i in range(numSteps):
+    action = rng.uniform(env.action_space.low, env.action_space.high)
+    start = time.perf_counter()
+    _, _, done, info = stepFn(action)
+    latencies[i] = time.perf_counter()-start
+    physicsSteps[i] = info['physicsSteps']
+    if done:
+      env.reset()
+  return {
+      'stepsPerSec': numSteps/latencies.sum(),
+      'stepLatencyP50': float(np.percentile(latencies, 50)),
+      'stepLatencyP99': float(np.percentile(latencies, 99)),
+      'physicsStepsPerAction': float(physicsSteps.mean()),
+  }
+
+def benchReset(env, numResets):
+  start = time.perf_counter()
+  for _ in range(numResets):
+    env.reset()
+  return numResets/(time.perf_counter()-start)
+
+def benchPhysicsStep(env, numSteps):
+  env.reset()
+  start = time.perf_counter()
+  for _ in range(numSteps):
+    env._p.stepSimulation()
+  return 1e6*(time.perf_counter()-start)/numSteps
+
+def _memoryWorker(remote, envCls, numEnvs, kwargs):
+  #the first env also pays for loading the engine and the assets, leave it out
+  envs = [envCls(**kwargs)]
+  before = _rssBytes()
+  envs += [envCls(**kwargs) for _ in range(numEnvs)]
+  remote.send((_rssBytes()-before)/numEnvs/2.**20)
+  for env in envs:
+    env.close()
+
+#measured in a fresh process, memory freed by earlier envs would otherwise be reused
+def benchMemory(envCls, numEnvs, **kwargs):
+  ctx = mp.get_context('spawn')
+  remote, workRemote = ctx.Pipe()
+  proc = ctx.Process(target=_memoryWorker, args=(workRemote, envCls, numEnvs, kwargs))
+  proc.start()
+  workRemote.close()
+  try:
+    memoryPerEnvMB = remote.recv()
+  finally:
+    proc.join()
+  return memoryPerEnvMB
+
+def benchTask(envCls, numSteps, numResets, numEnvs, seed, **kwargs):
+  rng = np.random.RandomState(seed)
+  env = envCls(**kwargs)
+  env.seed(seed)
+  results = {}
+  try:
+    for path, stepFn in [('step', env.step), ('step2', env.step2)]:
+      results[path] = benchStep(env, stepFn, numSteps, rng)
+    resetsPerSec = benchReset(env, numResets)
+    physicsStepUs = benchPhysicsStep(env, 10*numSteps)
+  finally:
+    env.close()
+  memoryPerEnvMB = benchMemory(envCls, numEnvs, **kwargs)
+  for path in results:
+    results[path]['resetsPerSec'] = resetsPerSec
+    results[path]['physicsStepUs'] = physicsStepUs
+    results[path]['memoryPerEnvMB'] = memoryPerEnvMB
+  return results
+
+def run(tasks, numSteps=200, numResets=20, numEnvs=4, seed=0, **kwargs):
+  results = {
+      'meta': {
+          'python': platform.python_version(),
+          'pybullet': pybullet.getAPIVersion(),
+          'numpy': np.__version__,
+          'machine': platform.machine(),
+          'steps': numSteps,
+          'resets': numResets,
+          'seed': seed,
+      },
+      'tasks': {},
+  }
+  for name in tasks:
+    results['tasks'][name] = runTask(benchTask, TASKS[name], numSteps, numResets, numEnvs, seed, **kwargs)
+  #load times of the assets over all envs of this process
+  results['assets'] = AssetRegistry.get().report()
+  return results
+
+#list of (task, path, metric, baseline value, value) that are worse than the baseline by more than tolerance,
+#a path of the baseline that is missing from results is (task, path, None, None, why)
+def compare(results, baseline, tolerance=0.2):
+  regressions = []
+  for task, paths in baseline['tasks'].items():
+    for path, metrics in paths.items():
+      if path in ('skipped', 'error'):
+        continue
+      row = results['tasks'].get(task)
+      current = row.get(path) if row is not None else None
+      if current is None:
+        why = 'not run' if row is None else row.get('skipped') or row.get('error') or 'no %s results' % path
+        regressions.append((task, path, None, None, why))
+        continue
+      for metric, higherIsBetter in METRICS.items():
+        if metric not in metrics or metric not in current:
+          continue
+        old, new = metrics[metric], current[metric]
+        if higherIsBetter is None:
+          worse = abs(new-old) > tolerance*abs(old)
+        elif higherIsBetter:
+          worse = new < old*(1-tolerance)
+        else:
+          worse = new > old*(1+tolerance)
+        if worse:
+          regressions.append((task, path, metric, old, new))
+  return regressions
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Benchmark the Kuka task envs')
+  parser.add_argument('--tasks', nargs='+', default=list(TASKS), choices=list(TASKS))
+  parser.add_argument('--steps', type=int, default=200)
+  parser.add_argument('--resets', type=int, default=20)
+  parser.add_argument('--envs', type=int, default=4, help='envs created to measure memory per env')
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--fast-reset', action='store_true')
+  parser.add_argument('--output', help='write the results as JSON')
+  parser.add_argument('--save-baseline', help='write the results as the new baseline')
+  parser.add_argument('--baseline', help='compare against this baseline')
+  parser.add_argument('--tolerance', type=float, default=0.2)
+  args = parser.parse_args(argv)
+
+  results = run(args.tasks, args.steps, args.resets, args.envs, args.seed, fastReset=args.fast_reset)
+  text = json.dumps(results, indent=2)
+  #pybullet writes its own lines to stdout, so the files are the machine readable output
+  if not (args.output or args.save_baseline):
+    print(text)
+  for fileName in (args.output, args.save_baseline):
+    if fileName:
+      with open(fileName, 'w') as f:
+        f.write(text)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    for key in ('steps', 'seed'):
+      if baseline['meta'].get(key) != results['meta'][key]:
+        print('warning: baseline was run with %s=%s' % (key, baseline['meta'].get(key)), file=sys.stderr)
+    regressions = compare(results, baseline, args.tolerance)
+    for task, path, metric, old, new in regressions:
+      if metric is None:
+        print('MISSING %s %s: %s' % (task, path, new), file=sys.stderr)
+      else:
+        print('REGRESSION %s %s %s: %.6g -> %.6g' % (task, path, metric, old, new), file=sys.stderr)
+    if regressions:
+      return 1
+  errors = [(task, row['error']) for task, row in results['tasks'].items() if 'error' in row]
+  for task, error in errors:
+    print('ERROR %s: %s' % (task, error), file=sys.stderr)
+  return 1 if errors else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
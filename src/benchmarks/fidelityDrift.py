@@ -0,0 +1,108 @@
+#Success rate drift between the fidelity profiles of the task envs: the same seeded starts and scripted
+#actions are played in every profile, the report has the success rate, throughput and physics step cost of
+#each profile and, against the first profile, the drift of the success rate and the share of episodes with
+#the same outcome
+#usage (from src):
+#  python -m benchmarks.fidelityDrift --episodes 50 --output drift.json
+#  python -m benchmarks.fidelityDrift --max-drift 0.05
+#with --max-drift the exit code is 1 if a success rate drifted by more than max-drift or a task raises
+import argparse
+import json
+import sys
+import time
+import numpy as np
+from benchmarks.envBench import TASKS, benchPhysicsStep, runTask
+from kuka.kukaContiEnv import FIDELITY_PROFILES
+
+#step2 action that drives the task to its terminal phase, noise is added per episode
+ACTIONS = {
+    'grasp': [0, 0, -0.02, 0, 0, 0, 0],
+    'stackInHand': [0, 0, -0.05, 0, 0, 0, 0],
+    'openDoor': [0.02, 0, 0, 0, 0, 0, 0],
+}
+
+#outcome (1 success, 0 failure) of every episode, all start from getGoodInitState since step2 does not move
+#the arm out of the reset pose
+def runEpisodes(env, task, numEpisodes, seed, noise=0.02, maxSteps=12):
+  rng = np.random.RandomState(seed)
+  env.seed(seed)
+  outcomes = np.zeros(numEpisodes, dtype=np.int8)
+  numSteps = 0
+  start = time.perf_counter()
+  for ep in range(numEpisodes):
+    env.getGoodInitState()
+    for _ in range(maxSteps):
+      action = np.array(ACTIONS[task])+rng.uniform(-noise, noise, 7)
+      _, reward, done, _ = env.step2(action)
+      numSteps += 1
+      if done:
+        break
+    outcomes[ep] = env.terminated and reward > 0
+  seconds = time.perf_counter()-start
+  return outcomes, numSteps/seconds, numEpisodes/seconds
+
+def driftTask(envCls, task, profiles, numEpisodes, seed, **kwargs):
+  results = {}
+  reference = None
+  for fidelity in profiles:
+    env = envCls(fidelity=fidelity, **kwargs)
+    try:
+      outcomes, stepsPerSec, episodesPerSec = runEpisodes(env, task, numEpisodes, seed)
+      physicsStepUs = benchPhysicsStep(env, 2000)
+    finally:
+      env.close()
+    results[fidelity] = {
+        'successRate': float(outcomes.mean()),
+        'stepsPerSec': stepsPerSec,
+        'episodesPerSec': episodesPerSec,
+        'physicsStepUs': physicsStepUs,
+    }
+    if reference is None:
+      reference = outcomes
+    else:
+      results[fidelity]['drift'] = float(outcomes.mean()-reference.mean())
+      results[fidelity]['agreement'] = float((outcomes == reference).mean())
+  return results
+
+def run(tasks, profiles, numEpisodes=50, seed=0, **kwargs):
+  results = {'meta': {'episodes': numEpisodes, 'seed': seed, 'profiles': profiles}, 'tasks': {}}
+  for name in tasks:
+    results['tasks'][name] = runTask(driftTask, TASKS[name], name, profiles, numEpisodes, seed, **kwargs)
+  return results
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Compare the success rates of the fidelity profiles')
+  parser.add_argument('--tasks', nargs='+', default=list(TASKS), choices=list(TASKS))
+  parser.add_argument('--profiles', nargs='+', default=['eval', 'train_fast'], choices=list(FIDELITY_PROFILES),
+          help='the first profile is the reference')
+  parser.add_argument('--episodes', type=int, default=50)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--fast-reset', action='store_true')
+  parser.add_argument('--output', help='write the results as JSON')
+  parser.add_argument('--max-drift', type=float)
+  args = parser.parse_args(argv)
+
+  results = run(args.tasks, args.profiles, args.episodes, args.seed, fastReset=args.fast_reset)
+  text = json.dumps(results, indent=2)
+  if args.output:
+    with open(args.output, 'w') as f:
+      f.write(text)
+  else:
+    print(text)
+
+  failed = False
+  for task, profiles in results['tasks'].items():
+    if 'error' in profiles:
+      print('ERROR %s: %s' % (task, profiles['error']), file=sys.stderr)
+      failed = True
+      continue
+    for fidelity, metrics in profiles.items():
+      if not isinstance(metrics, dict) or 'drift' not in metrics:
+        continue
+      if args.max_drift is not None and abs(metrics['drift']) > args.max_drift:
+        print('DRIFT %s %s: %+.3f' % (task, fidelity, metrics['drift']), file=sys.stderr)
+        failed = True
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,48 @@
+#Per-step cost of assembling the observation and reading the end effector height for the termination check,
+#the list based assembly the envs used before against the preallocated buffer of KukaContiEnv.getExtendedObservation
+#usage (from src): python -m benchmarks.observationBench [numCalls]
+import sys
+import timeit
+import numpy as np
+from kuka.kukaContiGraspEnv import KukaContiGraspEnv
+
+def listObservation(env):
+  kuka = env._kuka
+  p = env._p
+  observation = []
+  jointStates = list(p.getJointStates(kuka.kukaUid, range(kuka.kukaEndEffectorIndex+1)))
+  jointPos = []
+  for state in jointStates:
+    jointPos.append(list(state)[0])
+  state = p.getLinkState(kuka.kukaUid,kuka.kukaEndEffectorIndex)
+  observation.extend(jointPos)
+  observation.extend(list(state[0]))
+  observation.extend(list(p.getEulerFromQuaternion(state[1])))
+
+  eeState = p.getLinkState(kuka.kukaUid,kuka.kukaEndEffectorIndex)
+  blockPos,blockOrn = p.getBasePositionAndOrientation(env.blockUid)
+  invEEPos,invEEOrn = p.invertTransform(eeState[0],eeState[1])
+  blockPosInEE,blockOrnInEE = p.multiplyTransforms(invEEPos,invEEOrn,blockPos,blockOrn)
+  observation.extend(list(blockPosInEE))
+  observation.extend(list(p.getEulerFromQuaternion(blockOrnInEE)))
+
+  state = p.getLinkState(kuka.kukaUid,kuka.kukaEndEffectorIndex)
+  return np.array(observation), state[0][2]
+
+def bufferObservation(env):
+  return env.getExtendedObservation().copy(), env._kuka.endEffectorState[0][2]
+
+def bufferObservationView(env):
+  return env.getExtendedObservation(), env._kuka.endEffectorState[0][2]
+
+def main(numCalls=20000):
+  env = KukaContiGraspEnv()
+  env.reset()
+  assert np.allclose(listObservation(env)[0], bufferObservation(env)[0], atol=1e-6)
+  for name, fn in [('list', listObservation), ('buffer copy', bufferObservation), ('buffer view', bufferObservationView)]:
+    seconds = min(timeit.repeat(lambda: fn(env), number=numCalls, repeat=7))
+    print('%-12s %8.2f us/step' % (name, 1e6*seconds/numCalls))
+  env.close()
+
+if __name__ == '__main__':
+  main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,86 @@
+#Throughput against success rate of the task envs over a grid of physics settings: step rate, substeps,
+#solver iterations and action repeat. Every setting plays the same seeded starts and scripted actions as
+#benchmarks.fidelityDrift, the first setting of the grid is the reference for the drift and agreement
+#usage (from src):
+#  python -m benchmarks.physicsSweep --rates 240 120 --substeps 0 2 --iterations 150 50 --output sweep.json
+#the exit code is 1 if a task raises
+import argparse
+import itertools
+import json
+import sys
+from benchmarks.envBench import TASKS, benchPhysicsStep, runTask
+from benchmarks.fidelityDrift import runEpisodes
+
+def sweepTask(envCls, task, settings, numEpisodes, seed, **kwargs):
+  results = []
+  reference = None
+  for rate, numSubSteps, numSolverIterations, actionRepeat in settings:
+    env = envCls(timeStep=1./rate, numSubSteps=numSubSteps, numSolverIterations=numSolverIterations, \
+            actionRepeat=actionRepeat, **kwargs)
+    try:
+      outcomes, stepsPerSec, episodesPerSec = runEpisodes(env, task, numEpisodes, seed)
+      physicsStepUs = benchPhysicsStep(env, 2000)
+    finally:
+      env.close()
+    row = {
+        'rate': rate,
+        'numSubSteps': numSubSteps,
+        'numSolverIterations': numSolverIterations,
+        'actionRepeat': actionRepeat,
+        'successRate': float(outcomes.mean()),
+        'stepsPerSec': stepsPerSec,
+        'episodesPerSec': episodesPerSec,
+        'physicsStepUs': physicsStepUs,
+    }
+    if reference is None:
+      reference = outcomes
+    else:
+      row['drift'] = float(outcomes.mean()-reference.mean())
+      row['agreement'] = float((outcomes == reference).mean())
+    results.append(row)
+  return results
+
+def run(tasks, settings, numEpisodes=20, seed=0, **kwargs):
+  results = {'meta': {'episodes': numEpisodes, 'seed': seed}, 'tasks': {}}
+  for name in tasks:
+    results['tasks'][name] = runTask(sweepTask, TASKS[name], name, settings, numEpisodes, seed, **kwargs)
+  return results
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Sweep the physics settings of the Kuka task envs')
+  parser.add_argument('--tasks', nargs='+', default=list(TASKS), choices=list(TASKS))
+  parser.add_argument('--rates', nargs='+', type=float, default=[240, 120], help='physics steps per second')
+  parser.add_argument('--substeps', nargs='+', type=int, default=[0])
+  parser.add_argument('--iterations', nargs='+', type=int, default=[150, 50], help='solver iterations')
+  parser.add_argument('--repeats', nargs='+', type=int, default=[1], help='action repeats')
+  parser.add_argument('--episodes', type=int, default=20)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--fidelity', default='eval')
+  parser.add_argument('--output', help='write the results as JSON')
+  args = parser.parse_args(argv)
+
+  settings = list(itertools.product(args.rates, args.substeps, args.iterations, args.repeats))
+  results = run(args.tasks, settings, args.episodes, args.seed, fidelity=args.fidelity)
+  if args.output:
+    with open(args.output, 'w') as f:
+      f.write(json.dumps(results, indent=2))
+
+  print('%-12s %6s %4s %5s %4s %8s %8s %8s %10s %9s' % ('task', 'rate', 'sub', 'iters', 'rep', 'success', 'drift', 'agree', 'episodes/s', 'physUs'))
+  failed = False
+  for task, rows in results['tasks'].items():
+    if 'skipped' in rows:
+      print('%-12s skipped: %s' % (task, rows['skipped']))
+      continue
+    if 'error' in rows:
+      print('%-12s ERROR: %s' % (task, rows['error']))
+      failed = True
+      continue
+    for row in rows:
+      print('%-12s %6g %4d %5d %4d %8.3f %8s %8s %10.2f %9.1f' % (task, row['rate'], row['numSubSteps'], \
+              row['numSolverIterations'], row['actionRepeat'], row['successRate'], \
+              '%+.3f' % row['drift'] if 'drift' in row else '-', '%.3f' % row['agreement'] if 'agreement' in row else '-', \
+              row['episodesPerSec'], row['physicsStepUs']))
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,303 @@
+#Checks that the task envs are reproducible in DIRECT mode: the same seed gives a bit-identical rollout
+#in a fresh env and again in the same env, a different seed gives a different one
+#usage (from src):
+#  python -m benchmarks.reproducibility [--tasks grasp stackInHand] [--episodes 3] [--fast-reset]
+#with --motors the seeded step and step2 rollouts, terminal phases included, are compared instead with the ones
+#where every motor command goes out every time with one setJointMotorControl2 call per joint, as before
+#Kuka.setMotors and the scripted phases, with --phases with the ones where the terminal phases run the hand-written
+#loops the scripted phases replaced, with --recorder that a TrajectoryRecorder records every start with the
+#observation and joint positions it returned, with --rate that the terminal phases end with the end effector target
+#at the same height at that step rate as at 240 Hz where a phase moves it (the grasp lift)
+#the exit code is 1 if a check fails or a task raises
+import argparse
+import contextlib
+import shutil
+import sys
+import tempfile
+import numpy as np
+import pybullet as p
+from benchmarks.envBench import TASKS, runTask
+from kuka.kuka import Kuka
+from kuka.scriptedPhase import JointTrack
+from kuka.trajectoryRecorder import TrajectoryRecorder, TrajectoryReader
+
+#observations, rewards and dones of numEpisodes episodes, the actions are drawn from the same seed
+def rollout(env, seed, numEpisodes=3, maxSteps=12):
+  rng = np.random.default_rng(seed)
+  rows = []
+  ob = env.reset(seed=seed)
+  for _ in range(numEpisodes):
+    rows.append(np.append(ob, [0, 0]))
+    for _ in range(maxSteps):
+      action = rng.uniform(env.action_space.low, env.action_space.high)
+      ob, reward, done, _ = env.step(action)
+      rows.append(np.append(ob, [reward, done]))
+      if done:
+        break
+    #later episodes continue the random stream of the first reset
+    ob = env.reset()
+  return np.array(rows)
+
+#step2 rollout with the end effector driven to the object the observation is relative to, so the episodes reach
+#their terminal phase. Every other episode starts from getGoodInitState. Returns the rows, and the joint positions after every episode, in one
+#array and the number of terminal phases.
+def scriptedRollout(env, seed, numEpisodes=3, maxSteps=12, speed=0.02, noise=0.02):
+  rng = np.random.default_rng(seed)
+  rows = []
+  numTerminal = 0
+  env.reset(seed=seed)
+  for episode in range(numEpisodes):
+    ob = env.getGoodInitState()[0] if episode % 2 == 0 else env.reset()
+    rows.append(np.append(ob, [0, 0]))
+    for _ in range(maxSteps):
+      action = rng.uniform(-noise, noise, 7)
+      action[:3] += np.clip(np.subtract(env.getObjectPose()[0], env._kuka.endEffectorState[0]), -speed, speed)
+      ob, reward, done, _ = env.step2(action)
+      rows.append(np.append(ob, [reward, done]))
+      if done:
+        break
+    numTerminal += env.terminated
+    rows.append(np.array(env.getCurrentJointPos()))
+  return np.concatenate(rows), numTerminal
+
+#Kuka.setMotors and JointTrack.apply as the motor commands were sent before them: every command every time, one
+#setJointMotorControl2 call per joint
+def setMotorsPerJoint(self, jointIndices, targetPositions, forces, positionGains, velocityGains):
+  for motor in zip(jointIndices, targetPositions, forces, positionGains, velocityGains):
+    jointIndex, target, force, positionGain, velocityGain = motor
+    self._p.setJointMotorControl2(self.kukaUid, jointIndex, p.POSITION_CONTROL, targetPosition=target, force=force, \
+            positionGain=positionGain, velocityGain=velocityGain)
+    self.motorTargets[jointIndex] = (float(target), force, positionGain, velocityGain)
+  return True
+
+def applyPerJoint(self, pybullet_client, bodyUid, motorTargets=None):
+  targets = self.targets() if callable(self.targets) else self.targets
+  positionGains = self.positionGains or [0.1]*len(self.jointIndices)
+  velocityGains = self.velocityGains or [1.0]*len(self.jointIndices)
+  for motor in zip(self.jointIndices, targets, self.forces, positionGains, velocityGains):
+    jointIndex, target, force, positionGain, velocityGain = motor
+    pybullet_client.setJointMotorControl2(bodyUid, jointIndex, p.POSITION_CONTROL, targetPosition=target, \
+            targetVelocity=0, force=force, positionGain=positionGain, velocityGain=velocityGain)
+    if motorTargets is not None:
+      motorTargets[jointIndex] = (float(target), force, positionGain, velocityGain)
+  return True
+
+@contextlib.contextmanager
+def perJointMotors():
+  saved = Kuka.setMotors, JointTrack.apply
+  Kuka.setMotors, JointTrack.apply = setMotorsPerJoint, applyPerJoint
+  try:
+    yield
+  finally:
+    Kuka.setMotors, JointTrack.apply = saved
+
+#the terminal phases as the tasks ran them before ScriptedPhase, 1000 ticks at 240 Hz. eeState is the end effector
+#link state the step read.
+def setFingers(env, fingerAngle):
+  kuka = env._kuka
+  env._p.setJointMotorControl2(kuka.kukaUid, 8, p.POSITION_CONTROL, targetPosition=-fingerAngle, force=kuka.fingerAForce)
+  env._p.setJointMotorControl2(kuka.kukaUid, 11, p.POSITION_CONTROL, targetPosition=fingerAngle, force=kuka.fingerBForce)
+  env._p.setJointMotorControl2(kuka.kukaUid, 10, p.POSITION_CONTROL, targetPosition=0, force=kuka.fingerTipForce)
+  env._p.setJointMotorControl2(kuka.kukaUid, 13, p.POSITION_CONTROL, targetPosition=0, force=kuka.fingerTipForce)
+
+def graspLoop(env, eeState):
+  fingerAngle = 0.3
+  for _ in range(1000):
+    env._kuka.applyAction([0, 0, 0.001, 0, fingerAngle])
+    env._p.stepSimulation()
+    fingerAngle = max(fingerAngle-(0.3/100.), 0)
+
+def releaseLoop(env, eeState):
+  fingerAngle = 0
+  for _ in range(1000):
+    setFingers(env, fingerAngle)
+    env._p.stepSimulation()
+    fingerAngle = min(fingerAngle+(0.03/100.), 0.3)
+
+def pullLoop(env, eeState):
+  kuka = env._kuka
+  actualEndEffectorPos = list(eeState[0])
+  actualEndEffectorOrn = list(eeState[1])
+  fingerAngle = 0.3
+  for _ in range(1000):
+    setFingers(env, fingerAngle)
+    actualEndEffectorPos[0] -= 0.00025
+    actualEndEffectorPos[1] -= 0.00025
+    jPos = kuka.calculateIK(actualEndEffectorPos, actualEndEffectorOrn)
+    for j in range(kuka.kukaEndEffectorIndex+1):
+      env._p.setJointMotorControl2(bodyIndex=kuka.kukaUid, jointIndex=j, controlMode=p.POSITION_CONTROL, \
+              targetPosition=jPos[j], targetVelocity=0, force=kuka.maxForce, positionGain=0.03, velocityGain=1)
+    env._p.stepSimulation()
+    fingerAngle = max(fingerAngle-(0.3/100.), 0)
+
+LOOPS = {'grasp': graspLoop, 'stackInHand': releaseLoop, 'openDoor': pullLoop}
+
+#(check, passed) for one task
+def checkTask(envCls, seed, numEpisodes, **kwargs):
+  envA = envCls(**kwargs)
+  envB = envCls(**kwargs)
+  try:
+    first = rollout(envA, seed, numEpisodes)
+    fresh = rollout(envB, seed, numEpisodes)
+    again = rollout(envA, seed, numEpisodes)
+    other = rollout(envB, seed+1, numEpisodes)
+  finally:
+    envA.close()
+    envB.close()
+  return [
+      ('same seed, fresh env', np.array_equal(first, fresh)),
+      ('same seed, same env', np.array_equal(first, again)),
+      ('other seed differs', not np.array_equal(first[:1], other[:1])),
+  ]
+
+#(check, passed) for one task, the rollouts are played with the grouped motor commands and again per joint
+def checkMotors(envCls, seed, numEpisodes, **kwargs):
+  results = []
+  for perJoint in (False, True):
+    with perJointMotors() if perJoint else contextlib.nullcontext():
+      env = envCls(**kwargs)
+      try:
+        results.append((rollout(env, seed, numEpisodes), scriptedRollout(env, seed, numEpisodes)))
+      finally:
+        env.close()
+  (stepRows, (step2Rows, numTerminal)), (stepPerJoint, (step2PerJoint, _)) = results
+  return [
+      ('step, per joint motors', np.array_equal(stepRows, stepPerJoint)),
+      ('step2 and %d terminal phases, per joint motors' % numTerminal, np.array_equal(step2Rows, step2PerJoint)),
+      ('step2 reached a terminal phase', numTerminal > 0),
+  ]
+
+#(check, passed) for one task, the step2 rollouts are played with the scripted terminal phases and again with the
+#hand-written loops
+def checkPhases(envCls, task, seed, numEpisodes, **kwargs):
+  results = []
+  for loops in (False, True):
+    env = envCls(**kwargs)
+    if loops:
+      env._runPhase = lambda phase: LOOPS[task](env, env._kuka.endEffectorState)
+    try:
+      results.append(scriptedRollout(env, seed, numEpisodes))
+    finally:
+      env.close()
+  (rows, numTerminal), (loopRows, _) = results
+  return [
+      ('step2 and %d terminal phases, hand-written loops' % numTerminal, np.array_equal(rows, loopRows)),
+      ('step2 reached a terminal phase', numTerminal > 0),
+  ]
+
+#records the height the end effector target ends at after every terminal phase of env, None for a phase that
+#leaves it where the step put it
+def recordPhaseHeights(env, heights):
+  runPhase = env._runPhase
+  def run(phase):
+    start = float(env._kuka.endEffectorPos[2])
+    ticks = runPhase(phase)
+    end = float(env._kuka.endEffectorPos[2])
+    heights.append(None if end == start else end)
+    return ticks
+  env._runPhase = run
+
+#(check, passed) for one task, the step2 rollouts are played at 240 Hz and at rate. The terminal phases are written
+#for 240 Hz and rescaled to rate, a phase that moves the end effector target has to end within tol (m) of the same
+#height.
+def checkRate(envCls, rate, seed, numEpisodes, tol=2e-3, **kwargs):
+  heights = []
+  for timeStep in (1./240., 1./rate):
+    heights.append([])
+    env = envCls(timeStep=timeStep, **kwargs)
+    recordPhaseHeights(env, heights[-1])
+    try:
+      scriptedRollout(env, seed, numEpisodes)
+    finally:
+      env.close()
+  reference, rateHeights = heights
+  same = len(reference) == len(rateHeights) and all((a is None and b is None) or \
+          (a is not None and b is not None and abs(a-b) <= tol) for a, b in zip(reference, rateHeights))
+  numMoved = sum(height is not None for height in reference)
+  return [
+      ('%d terminal phases moving the end effector at %g Hz, same height as at 240 Hz' % (numMoved, rate), same),
+      ('step2 reached a terminal phase', len(reference) > 0),
+  ]
+
+#(check, passed) for one task. A fresh recorder begins with getGoodInitState, then the other starts follow, each
+#with two step2 actions, and at last restoreState of a snapshot of the reset before. The first row of every episode
+#has to hold the observation and joint positions of its start.
+def checkRecorder(envCls, seed, numEpisodes, **kwargs):
+  rng = np.random.default_rng(seed)
+  directory = tempfile.mkdtemp()
+  env = TrajectoryRecorder(envCls(**kwargs), directory)
+  starts = []
+  def record(name, ob):
+    starts.append((name, np.array(ob, dtype=np.float32), env.getCurrentJointPos()))
+    for _ in range(2):
+      env.step2(rng.uniform(env.action_space.low, env.action_space.high))
+  try:
+    env.seed(seed)
+    goodOb, goodJointPos = env.getGoodInitState()
+    extra = env.getExtraInfo()
+    record('getGoodInitState', goodOb)
+    for _ in range(numEpisodes):
+      record('getMidInitState', env.getMidInitState())
+      if hasattr(env.env, 'getGoodMidInitState'):
+        record('getGoodMidInitState', env.getGoodMidInitState())
+      env.setGoodInitState(goodOb, list(goodJointPos), extra)
+      record('setGoodInitState', env._observation)
+    #a cold reset drops the snapshots, the one restored is taken after the last reset
+    ob = env.reset()
+    handle = env.cloneState()
+    record('reset', ob)
+    record('restoreState', env.restoreState(handle))
+    env.flush()
+    data = TrajectoryReader(directory)
+    episodes = data.read('episode')
+    firstRows = np.flatnonzero(np.diff(np.concatenate([[-1], episodes])) != 0)
+    checks = [('one episode per start', len(firstRows) == len(starts) and len(np.unique(episodes)) == len(starts))]
+    for name in dict.fromkeys(start[0] for start in starts):
+      passed = len(firstRows) == len(starts) and all(np.array_equal(data.get('obs', [row])[0], ob) and \
+              np.array_equal(data.get('jointPos', [row])[0], jointPos) \
+              for row, (startName, ob, jointPos) in zip(firstRows, starts) if startName == name)
+      checks.append(('%s, first recorded obs and joints' % name, passed))
+  finally:
+    env.close()
+    shutil.rmtree(directory)
+  return checks
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Check that seeded rollouts of the Kuka task envs are bit-identical')
+  parser.add_argument('--tasks', nargs='+', default=list(TASKS), choices=list(TASKS))
+  parser.add_argument('--episodes', type=int, default=3)
+  parser.add_argument('--seed', type=int, default=0)
+  parser.add_argument('--fast-reset', action='store_true')
+  parser.add_argument('--motors', action='store_true', help='compare with the motor commands sent per joint')
+  parser.add_argument('--phases', action='store_true', help='compare with the hand-written terminal loops')
+  parser.add_argument('--recorder', action='store_true', help='check the starts a TrajectoryRecorder records')
+  parser.add_argument('--rate', type=float, help='compare the terminal end effector height at this step rate with 240 Hz')
+  args = parser.parse_args(argv)
+
+  failed = False
+  for name in args.tasks:
+    if args.motors:
+      checks = runTask(checkMotors, TASKS[name], args.seed, args.episodes, fastReset=args.fast_reset)
+    elif args.phases:
+      checks = runTask(checkPhases, TASKS[name], name, args.seed, args.episodes, fastReset=args.fast_reset)
+    elif args.recorder:
+      checks = runTask(checkRecorder, TASKS[name], args.seed, args.episodes, fastReset=args.fast_reset)
+    elif args.rate:
+      checks = runTask(checkRate, TASKS[name], args.rate, args.seed, args.episodes, fastReset=args.fast_reset)
+    else:
+      checks = runTask(checkTask, TASKS[name], args.seed, args.episodes, fastReset=args.fast_reset)
+    #runTask gives a dict for a task that was skipped or raised
+    if isinstance(checks, dict):
+      if 'skipped' in checks:
+        print('%s skipped: %s' % (name, checks['skipped']))
+      else:
+        print('%s FAILED: %s' % (name, checks['error']))
+        failed = True
+      continue
+    for check, passed in checks:
+      print('%s %s: %s' % (name, check, 'ok' if passed else 'FAILED'))
+      failed = failed or not passed
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
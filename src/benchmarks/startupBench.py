@@ -0,0 +1,109 @@
+#Startup cost of the task envs: import time of the task modules in a fresh interpreter, the part of it spent
+#on numpy, gym and pybullet, the time to make an env with and without lazy and the time to start a pool of workers
+#usage (from src):
+#  python -m benchmarks.startupBench --output startup.json
+#  python -m benchmarks.startupBench --max-import-ms 400 --max-lazy-ms 10
+#with a budget the exit code is 1 if an import or a lazy construction took longer or a task raises
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import numpy as np
+from benchmarks.envBench import TASKS, runTask
+from kuka.kukaContiSubprocVecEnv import KukaContiSubprocVecEnv
+
+MODULES = {
+    'grasp': 'kuka.kukaContiGraspEnv',
+    'stackInHand': 'kuka.kukaContiStackInHandEnv',
+    'openDoor': 'kuka.kukaContiOpenDoorEnv',
+}
+DEPENDENCIES = 'numpy, gym, pybullet'
+
+#median ms of importing modules in a fresh interpreter, the interpreter start itself is not counted
+def importMs(modules, repeats=5):
+  code = 'import time; start = time.perf_counter(); import %s; print(1e3*(time.perf_counter()-start))' % modules
+  env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [os.getcwd(), os.environ.get('PYTHONPATH')])))
+  times = []
+  for _ in range(repeats):
+    out = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env, \
+            check=True).stdout
+    #pybullet writes its own lines to stdout, the time is the last one
+    times.append(float(out.decode().strip().splitlines()[-1]))
+  return float(np.median(times))
+
+#median ms of making an env and of its first reset, the first env of the process is left out
+def constructMs(envCls, repeats=5, **kwargs):
+  envCls(**kwargs).close()
+  constructTimes = []
+  resetTimes = []
+  for _ in range(repeats):
+    start = time.perf_counter()
+    env = envCls(**kwargs)
+    constructTimes.append(1e3*(time.perf_counter()-start))
+    start = time.perf_counter()
+    env.reset()
+    resetTimes.append(1e3*(time.perf_counter()-start))
+    env.close()
+  return float(np.median(constructTimes)), float(np.median(resetTimes))
+
+#ms until a KukaContiSubprocVecEnv of numWorkers workers is ready to take a reset
+def poolMs(envCls, numWorkers, **kwargs):
+  start = time.perf_counter()
+  envs = KukaContiSubprocVecEnv(envCls, numWorkers, **kwargs)
+  seconds = time.perf_counter()-start
+  envs.close()
+  return 1e3*seconds
+
+def startupTask(name, repeats, numWorkers, **kwargs):
+  row = {'importMs': importMs(MODULES[name], repeats)}
+  row['constructMs'], row['firstResetMs'] = constructMs(TASKS[name], repeats, **kwargs)
+  row['lazyConstructMs'], row['lazyFirstResetMs'] = constructMs(TASKS[name], repeats, lazy=True, **kwargs)
+  if numWorkers > 0:
+    row['poolMs'] = poolMs(TASKS[name], numWorkers, **kwargs)
+    row['lazyPoolMs'] = poolMs(TASKS[name], numWorkers, lazy=True, **kwargs)
+  return row
+
+def run(tasks, repeats=5, numWorkers=8, **kwargs):
+  results = {'meta': {'repeats': repeats, 'workers': numWorkers}, 'dependencyImportMs': importMs(DEPENDENCIES, repeats), \
+          'tasks': {}}
+  for name in tasks:
+    results['tasks'][name] = runTask(startupTask, name, repeats, numWorkers, **kwargs)
+  return results
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Measure the startup cost of the Kuka task envs')
+  parser.add_argument('--tasks', nargs='+', default=list(TASKS), choices=list(TASKS))
+  parser.add_argument('--repeats', type=int, default=5)
+  parser.add_argument('--workers', type=int, default=8, help='workers of the pool, 0 leaves the pool out')
+  parser.add_argument('--fast-reset', action='store_true')
+  parser.add_argument('--output', help='write the results as JSON')
+  parser.add_argument('--max-import-ms', type=float, help='budget for importing a task module')
+  parser.add_argument('--max-lazy-ms', type=float, help='budget for making an env with lazy=True')
+  args = parser.parse_args(argv)
+
+  results = run(args.tasks, args.repeats, args.workers, fastReset=args.fast_reset)
+  text = json.dumps(results, indent=2)
+  if args.output:
+    with open(args.output, 'w') as f:
+      f.write(text)
+  else:
+    print(text)
+
+  failed = False
+  for task, row in results['tasks'].items():
+    if 'skipped' in row:
+      continue
+    if 'error' in row:
+      print('ERROR %s: %s' % (task, row['error']), file=sys.stderr)
+      failed = True
+      continue
+    for metric, budget in (('importMs', args.max_import_ms), ('lazyConstructMs', args.max_lazy_ms)):
+      if budget is not None and row[metric] > budget:
+        print('OVER BUDGET %s %s: %.1f ms > %.1f ms' % (task, metric, row[metric], budget), file=sys.stderr)
+        failed = True
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,88 @@
+import os
+import time
+import pybullet_data
+
+#the asset files of the task envs as (root, path under the root): the root 'urdfRoot' is the urdfRoot of the env,
+#pybullet_data by default, 'URDF_DATA' the directory in the URDF_DATA environment variable
+ASSET_FILES = {
+    'plane': ('urdfRoot', 'plane.urdf'),
+    'table': ('urdfRoot', 'table/table.urdf'),
+    'tray': ('urdfRoot', 'tray/tray.urdf'),
+    'kuka': ('urdfRoot', 'kuka_iiwa/kuka_with_gripper2.sdf'),
+    'cube': ('urdfRoot', 'cube_small.urdf'),
+    'door': ('URDF_DATA', 'door.urdf'),
+}
+
+#an asset whose root is not set, e.g. the door without URDF_DATA. Tools skip the task for it, any other error fails them.
+class MissingAssetRootError(FileNotFoundError):
+  pass
+
+class AssetRegistry(object):
+  #Resolves the asset files once and checks that they exist, then loads them by name into a physics client and
+  #records how long every load took. get returns one registry per process for the same roots, so all envs of a
+  #process share the resolved paths and the load times. pybullet itself caches the mesh files it read, process wide,
+  #so the first load of an asset is the slow one.
+  _registries = {}
+
+  def __init__(self, urdfRoot=pybullet_data.getDataPath(), urdfData=None):
+    self.roots = {'urdfRoot': urdfRoot, 'URDF_DATA': urdfData}
+    self._paths = {}
+    #name -> [loads, total seconds, seconds of the first load]
+    self._loadTimes = {}
+
+  #the registry of the process for urdfRoot, urdfData defaults to the URDF_DATA environment variable
+  @classmethod
+  def get(cls, urdfRoot=pybullet_data.getDataPath(), urdfData=None):
+    if urdfData is None:
+      urdfData = os.environ.get('URDF_DATA')
+    key = (urdfRoot, urdfData)
+    if key not in cls._registries:
+      cls._registries[key] = cls(urdfRoot, urdfData)
+    return cls._registries[key]
+
+  #the absolute path of an asset, resolved and checked on the first call
+  def path(self, name):
+    path = self._paths.get(name)
+    if path is None:
+      root, fileName = ASSET_FILES[name]
+      if self.roots[root] is None:
+        raise MissingAssetRootError('%s needs the %s environment variable' % (fileName, root))
+      path = os.path.abspath(os.path.join(self.roots[root], fileName))
+      if not os.path.isfile(path):
+        raise FileNotFoundError('asset %s not found: %s' % (name, path))
+      self._paths[name] = path
+    return path
+
+  def validate(self, names):
+    for name in names:
+      self.path(name)
+
+  #loadSDF for .sdf assets, loadURDF otherwise, the arguments are passed on. Returns what pybullet returns.
+  def load(self, pybullet_client, name, *args, **kwargs):
+    path = self.path(name)
+    start = time.perf_counter()
+    if path.endswith('.sdf'):
+      result = pybullet_client.loadSDF(path, *args, **kwargs)
+    else:
+      result = pybullet_client.loadURDF(path, *args, **kwargs)
+    seconds = time.perf_counter()-start
+    loadTimes = self._loadTimes.get(name)
+    if loadTimes is None:
+      self._loadTimes[name] = [1, seconds, seconds]
+    else:
+      loadTimes[0] += 1
+      loadTimes[1] += seconds
+    return result
+
+  #path, number of loads and load times in ms of every asset loaded so far
+  def report(self):
+    report = {}
+    for name, (loads, total, first) in self._loadTimes.items():
+      report[name] = {
+          'path': self._paths[name],
+          'loads': loads,
+          'firstMs': 1e3*first,
+          'meanMs': 1e3*total/loads,
+          'laterMeanMs': 1e3*(total-first)/(loads-1) if loads > 1 else None,
+      }
+    return report
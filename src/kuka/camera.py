@@ -0,0 +1,93 @@
+import pkgutil
+import numpy as np
+import pybullet as p
+
+RENDERERS = {
+    'tiny': p.ER_TINY_RENDERER,
+    'opengl': p.ER_BULLET_HARDWARE_OPENGL,
+}
+
+class Camera(object):
+  #Renders the image observation into one preallocated uint8 array of shape (height, width, channels).
+  #The channels are RGBA, or a single gray channel with grayscale, followed by depth (scaled to 0-255)
+  #and the segmentation mask (object uid) if they are requested.
+  #downsample renders at width/downsample x height/downsample, renderEvery=k renders on every k-th step
+  #and hands out the last image in between.
+  #renderer is 'tiny' (CPU, works headless) or 'opengl', which in DIRECT mode needs egl=True.
+  def __init__(self, pybullet_client, width, height, viewMatrix, projMatrix, renderer='tiny', egl=False, \
+          depth=False, segmentation=False, grayscale=False, downsample=1, renderEvery=1):
+    self._p = pybullet_client
+    self.width = width//downsample
+    self.height = height//downsample
+    self.viewMatrix = viewMatrix
+    self.projMatrix = projMatrix
+    self.renderer = RENDERERS[renderer]
+    self.depth = depth
+    self.segmentation = segmentation
+    self.grayscale = grayscale
+    self.renderEvery = renderEvery
+    self._lastStep = None
+    if egl:
+      eglRenderer = pkgutil.get_loader('eglRenderer')
+      self._p.loadPlugin(eglRenderer.get_filename(), "_eglRendererPlugin")
+
+    colorChannels = 1 if grayscale else 4
+    self.numChannels = self.imageShape(width, height, depth, segmentation, grayscale, downsample)[2]
+    self.image = np.zeros((self.height, self.width, self.numChannels), dtype=np.uint8)
+    self._color = self.image[:, :, :colorChannels]
+    #(name, first channel, last channel+1) of every part of image
+    self.planes = [('gray' if grayscale else 'rgba', 0, colorChannels)]
+    channel = colorChannels
+    if depth:
+      self._depth = self.image[:, :, channel]
+      self.planes.append(('depth', channel, channel+1))
+      channel += 1
+    if segmentation:
+      self._segmentation = self.image[:, :, channel]
+      self.planes.append(('segmentation', channel, channel+1))
+    self._flags = 0 if segmentation else p.ER_NO_SEGMENTATION_MASK
+
+  #the shape of the image of a Camera made with these arguments, without making one
+  @staticmethod
+  def imageShape(width, height, depth=False, segmentation=False, grayscale=False, downsample=1, **kwargs):
+    return (height//downsample, width//downsample, (1 if grayscale else 4)+int(depth)+int(segmentation))
+
+  #a fixed camera looking at target from distance, yaw, pitch and roll in degrees,
+  #the view and projection matrices are computed once here
+  @classmethod
+  def fromPose(cls, pybullet_client, width, height, target, distance, yaw, pitch, roll=0, fov=60, near=0.01, far=10, **kwargs):
+    viewMatrix = pybullet_client.computeViewMatrixFromYawPitchRoll(target, distance, yaw, pitch, roll, 2)
+    projMatrix = pybullet_client.computeProjectionMatrixFOV(fov, float(width)/height, near, far)
+    return cls(pybullet_client, width, height, viewMatrix, projMatrix, **kwargs)
+
+  #the next getImage renders, e.g. after a reset
+  def invalidate(self):
+    self._lastStep = None
+
+  @property
+  def shape(self):
+    return self.image.shape
+
+  #step is the step counter of the episode, a new episode always renders
+  def getImage(self, step=None):
+    if self.renderEvery > 1 and step is not None and self._lastStep is not None and \
+        self._lastStep <= step < self._lastStep+self.renderEvery:
+      return self.image
+    self._lastStep = step
+    self.render()
+    return self.image
+
+  def render(self):
+    _, _, rgba, depth, segmentation = self._p.getCameraImage(width=self.width, height=self.height, \
+            viewMatrix=self.viewMatrix, projectionMatrix=self.projMatrix, renderer=self.renderer, flags=self._flags)
+    rgba = np.asarray(rgba, dtype=np.uint8).reshape(self.height, self.width, 4)
+    if self.grayscale:
+      #ITU-R 601 luma in fixed point
+      gray = np.dot(rgba[:, :, :3], np.array([77, 150, 29], dtype=np.uint16)) >> 8
+      self._color[:, :, 0] = gray
+    else:
+      self._color[:] = rgba
+    if self.depth:
+      np.multiply(np.asarray(depth, dtype=np.float32).reshape(self.height, self.width), 255, out=self._depth, casting='unsafe')
+    if self.segmentation:
+      self._segmentation[:] = np.asarray(segmentation).reshape(self.height, self.width) & 0xFF
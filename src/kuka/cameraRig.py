@@ -0,0 +1,188 @@
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from .camera import Camera
+
+_PNG_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+
+def _pngChunk(tag, data):
+  return struct.pack('>I', len(data))+tag+data+struct.pack('>I', zlib.crc32(tag+data) & 0xffffffff)
+
+#8 bit PNG of a (height, width) or (height, width, 1-4) uint8 image, zlib releases the GIL while it compresses
+def encodePNG(image, level=6):
+  image = np.asarray(image, dtype=np.uint8)
+  if image.ndim == 2:
+    image = image[:, :, None]
+  height, width, channels = image.shape
+  #every row starts with filter type 0
+  raw = np.zeros((height, width*channels+1), dtype=np.uint8)
+  raw[:, 1:] = image.reshape(height, width*channels)
+  header = struct.pack('>IIBBBBB', width, height, 8, _PNG_COLOR_TYPES[channels], 0, 0, 0)
+  return b'\x89PNG\r\n\x1a\n'+_pngChunk(b'IHDR', header)+_pngChunk(b'IDAT', zlib.compress(raw.tobytes(), level))+_pngChunk(b'IEND', b'')
+
+class FrameWriter(object):
+  #Writes frames to directory on numWorkers background threads, so step only pays for a copy of the image.
+  #format 'png' writes every plane of every frame as directory/camera/ep000000_step0000_plane.png,
+  #'chunks' collects chunkSize frames of a camera and writes them as one compressed
+  #directory/camera/chunk_000000.npz with the arrays frames, episode and step.
+  #At most maxQueue frames or chunks wait for a worker. written counts the frames on disk in both formats,
+  #chunksWritten the chunks. When the queue is full,
+  #block=True makes submit wait (the time is counted in blockedSeconds) and block=False drops the frame
+  #(counted in dropped).
+  def __init__(self, directory, format='png', numWorkers=2, maxQueue=64, block=True, chunkSize=100):
+    if format not in ('png', 'chunks'):
+      raise ValueError('format must be png or chunks, not %s' % format)
+    self.directory = directory
+    self.format = format
+    self.block = block
+    self.chunkSize = chunkSize
+    self.submitted = 0
+    self.written = 0
+    self.chunksWritten = 0
+    self.dropped = 0
+    self.blockedSeconds = 0.0
+    self.maxQueueDepth = 0
+    self._queue = queue.Queue(maxsize=maxQueue)
+    self._chunks = {}
+    self._numChunks = {}
+    self._error = None
+    self._lock = threading.Lock()
+    self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(numWorkers)]
+    for worker in self._workers:
+      worker.start()
+
+  def _work(self):
+    while True:
+      job = self._queue.get()
+      if job is None:
+        break
+      try:
+        #a job returns the number of frames it wrote
+        numFrames = job()
+        with self._lock:
+          self.written += numFrames
+      except Exception as e:
+        self._error = e
+      finally:
+        self._queue.task_done()
+
+  def _put(self, job, block):
+    if self._error is not None:
+      raise self._error
+    try:
+      self._queue.put_nowait(job)
+    except queue.Full:
+      if not block:
+        self.dropped += 1
+        return
+      start = time.perf_counter()
+      self._queue.put(job)
+      self.blockedSeconds += time.perf_counter()-start
+    self.maxQueueDepth = max(self.maxQueueDepth, self._queue.qsize())
+
+  def _cameraDir(self, name):
+    path = os.path.join(self.directory, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+  #image is copied, the camera keeps rendering into its own buffer
+  def submit(self, name, episode, step, image, planes):
+    self.submitted += 1
+    if self.format == 'png':
+      image = image.copy()
+      prefix = os.path.join(self._cameraDir(name), 'ep%06d_step%04d' % (episode, step))
+      def job():
+        for plane, start, stop in planes:
+          with open('%s_%s.png' % (prefix, plane), 'wb') as f:
+            f.write(encodePNG(image[:, :, start:stop]))
+        return 1
+      self._put(job, self.block)
+      return
+    chunk = self._chunks.get(name)
+    if chunk is None:
+      chunk = self._chunks[name] = {
+          'frames': np.zeros((self.chunkSize,)+image.shape, dtype=np.uint8),
+          'episode': np.zeros(self.chunkSize, dtype=np.int32),
+          'step': np.zeros(self.chunkSize, dtype=np.int32),
+          'size': 0,
+      }
+    i = chunk['size']
+    chunk['frames'][i] = image
+    chunk['episode'][i] = episode
+    chunk['step'][i] = step
+    chunk['size'] += 1
+    if chunk['size'] == self.chunkSize:
+      self._flushChunk(name)
+
+  def _flushChunk(self, name):
+    chunk = self._chunks.pop(name, None)
+    if chunk is None or chunk['size'] == 0:
+      return
+    size = chunk['size']
+    index = self._numChunks.get(name, 0)
+    self._numChunks[name] = index+1
+    fileName = os.path.join(self._cameraDir(name), 'chunk_%06d.npz' % index)
+    def job():
+      np.savez_compressed(fileName, frames=chunk['frames'][:size], episode=chunk['episode'][:size], step=chunk['step'][:size])
+      with self._lock:
+        self.chunksWritten += 1
+      return size
+    #a dropped chunk would lose chunkSize frames, so chunks always wait for a free slot
+    self._put(job, True)
+
+  def stats(self):
+    return {
+        'submitted': self.submitted,
+        'written': self.written,
+        'chunksWritten': self.chunksWritten,
+        'dropped': self.dropped,
+        'blockedSeconds': self.blockedSeconds,
+        'queueDepth': self._queue.qsize(),
+        'maxQueueDepth': self.maxQueueDepth,
+    }
+
+  #writes the partial chunks and waits until everything is on disk
+  def close(self):
+    for name in list(self._chunks):
+      self._flushChunk(name)
+    for _ in self._workers:
+      self._queue.put(None)
+    for worker in self._workers:
+      worker.join()
+    self._workers = []
+    if self._error is not None:
+      raise self._error
+
+class CameraRig(object):
+  #Fixed cameras, each given by the keyword arguments of Camera.fromPose (width, height, target, distance,
+  #yaw, pitch, ...), rendered every renderEvery steps. With a directory the frames go to a FrameWriter,
+  #the remaining keyword arguments are passed on to it.
+  def __init__(self, pybullet_client, cameras, renderEvery=1, directory=None, **writerParams):
+    self.cameras = dict((name, Camera.fromPose(pybullet_client, **params)) for name, params in cameras.items())
+    self.renderEvery = renderEvery
+    self.writer = FrameWriter(directory, **writerParams) if directory is not None else None
+    self.episode = -1
+    self._lastStep = None
+
+  #step is the step counter of the episode, a step counter that goes back starts a new episode.
+  #Returns True if the cameras rendered.
+  def capture(self, step):
+    if self._lastStep is None or step <= self._lastStep:
+      self.episode += 1
+    self._lastStep = step
+    if step % self.renderEvery != 0:
+      return False
+    for name, camera in self.cameras.items():
+      camera.render()
+      if self.writer is not None:
+        self.writer.submit(name, self.episode, step, camera.image, camera.planes)
+    return True
+
+  def close(self):
+    if self.writer is not None:
+      self.writer.close()
+      self.writer = None
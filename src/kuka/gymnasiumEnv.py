@@ -0,0 +1,71 @@
+import functools
+import importlib
+import numpy as np
+import gymnasium
+from gymnasium import spaces
+
+#gymnasium ids of the task envs, the task env classes are only imported when an env is made
+ENV_IDS = {
+    'KukaContiGrasp-v0': 'kukaContiGraspEnv:KukaContiGraspEnv',
+    'KukaContiStackInHand-v0': 'kukaContiStackInHandEnv:KukaContiStackInHandEnv',
+    'KukaContiOpenDoor-v0': 'kukaContiOpenDoorEnv:KukaContiOpenDoorEnv',
+}
+
+def _loadClass(name):
+  module, cls = name.split(':')
+  return getattr(importlib.import_module('.'+module, __package__), cls)
+
+class GymnasiumKukaEnv(gymnasium.Env):
+  #Gymnasium API for a task env: reset(seed, options) returns (obs, info) and step returns
+  #(obs, reward, terminated, truncated, info). terminated is set once the terminal phase ran, truncated when the
+  #step limit of the task ends the episode before it. stepMethod picks step, step2 or stepPosDiff of the task env,
+  #the other keyword arguments are passed on to it. The task env itself is in env.
+  metadata = {'render_modes': ['rgb_array'], 'render_fps': 50}
+
+  def __init__(self, envCls, stepMethod='step', render_mode=None, **kwargs):
+    if isinstance(envCls, str):
+      envCls = _loadClass(envCls)
+    self.env = envCls(**kwargs)
+    self.render_mode = render_mode
+    self._step = getattr(self.env, stepMethod)
+    self.action_space = spaces.Box(self.env.action_space.low, self.env.action_space.high, dtype=np.float32)
+    self.observation_space = spaces.Box(self.env.observation_space.low, self.env.observation_space.high, dtype=np.float32)
+
+  #options are keyword arguments for the reset of the task env, e.g. finalJPos
+  def reset(self, seed=None, options=None):
+    super(GymnasiumKukaEnv, self).reset(seed=seed)
+    ob = self.env.reset(seed=seed, **(options or {}))
+    return ob, {}
+
+  def step(self, action):
+    ob, reward, done, info = self._step(action)
+    terminated = bool(self.env.terminated)
+    return ob, float(reward), terminated, bool(done) and not terminated, info
+
+  def render(self):
+    if self.render_mode == 'rgb_array':
+      return self.env.render('rgb_array')
+    return None
+
+  def close(self):
+    self.env.close()
+
+def register():
+  for envId, envCls in ENV_IDS.items():
+    if envId not in gymnasium.registry:
+      gymnasium.register(id=envId, entry_point=__name__+':GymnasiumKukaEnv', kwargs={'envCls': envCls})
+
+register()
+
+#gymnasium.make that registers the ids first, worker processes that unpickle it import this module
+def make(envId, **kwargs):
+  return gymnasium.make(envId, **kwargs)
+
+#numEnvs envs of envId in AsyncVectorEnv, whose workers write the observations into shared memory, or SyncVectorEnv.
+#The task envs keep copying their observations: with the final observation of an episode in info, a worker
+#would otherwise send the buffer after the reset overwrote it
+def makeVectorEnv(envId, numEnvs, asynchronous=True, **kwargs):
+  envFns = [functools.partial(make, envId, **kwargs) for _ in range(numEnvs)]
+  if asynchronous:
+    return gymnasium.vector.AsyncVectorEnv(envFns, shared_memory=True)
+  return gymnasium.vector.SyncVectorEnv(envFns)
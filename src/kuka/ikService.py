@@ -0,0 +1,72 @@
+#IK lookup grid for the Cartesian controller, which keeps the gripper pointing down.
+#Build it once offline, then pass it to Kuka as ikGrid:
+#  python -m kuka.ikService grid.npz [resolution]
+import sys
+import numpy as np
+
+#the workspace Kuka.moveEndEffector clamps the end effector to, z covers the reach of the tasks
+WORKSPACE = ((0.45, 0.75), (-0.22, 0.22), (0.0, 0.6))
+
+class IKGrid(object):
+  #Joint positions solved on a regular (x, y, z) grid, interpolated trilinearly in between
+  def __init__(self, axes, jointPoses):
+    self.axes = [np.asarray(axis, dtype=np.float64) for axis in axes]
+    self.jointPoses = np.asarray(jointPoses, dtype=np.float64)
+    self._low = np.array([axis[0] for axis in self.axes])
+    self._high = np.array([axis[-1] for axis in self.axes])
+    self._step = np.array([axis[1]-axis[0] for axis in self.axes])
+    self._last = np.array([len(axis)-2 for axis in self.axes])
+
+  def contains(self, pos):
+    pos = np.asarray(pos)
+    return bool(np.all(pos >= self._low) and np.all(pos <= self._high))
+
+  def interpolate(self, pos):
+    t = (np.asarray(pos)-self._low)/self._step
+    i = np.minimum(t.astype(int), self._last)
+    fx, fy, fz = t-i
+    x, y, z = i
+    c = self.jointPoses[x:x+2, y:y+2, z:z+2]
+    c = c[0]*(1-fx)+c[1]*fx
+    c = c[0]*(1-fy)+c[1]*fy
+    return c[0]*(1-fz)+c[1]*fz
+
+  def save(self, fileName):
+    np.savez_compressed(fileName, x=self.axes[0], y=self.axes[1], z=self.axes[2], jointPoses=self.jointPoses)
+
+  @classmethod
+  def load(cls, fileName):
+    data = np.load(fileName)
+    return cls((data['x'], data['y'], data['z']), data['jointPoses'])
+
+  #solve every grid point from the same start pose, so the grid does not depend on the order of the points
+  @classmethod
+  def build(cls, kuka, resolution=0.02, workspace=WORKSPACE):
+    axes = [np.linspace(low, high, int(round((high-low)/resolution))+1) for low, high in workspace]
+    jointPoses = None
+    for ix, x in enumerate(axes[0]):
+      for iy, y in enumerate(axes[1]):
+        for iz, z in enumerate(axes[2]):
+          for jointIndex in range(kuka.numJoints):
+            kuka._p.resetJointState(kuka.kukaUid, jointIndex, kuka.jointPositions[jointIndex])
+          solution = kuka.calculateIK([x, y, z], kuka.downOrn)
+          if jointPoses is None:
+            jointPoses = np.zeros([len(axis) for axis in axes]+[len(solution)])
+          jointPoses[ix, iy, iz] = solution
+    return cls(axes, jointPoses)
+
+def main(argv):
+  import pybullet as p
+  from pybullet_utils import bullet_client
+  from .kuka import Kuka
+  fileName = argv[0]
+  resolution = float(argv[1]) if len(argv) > 1 else 0.02
+  client = bullet_client.BulletClient(connection_mode=p.DIRECT)
+  kuka = Kuka(pybullet_client=client)
+  grid = IKGrid.build(kuka, resolution)
+  grid.save(fileName)
+  print('%s: %s grid points' % (fileName, 'x'.join(str(len(axis)) for axis in grid.axes)))
+  client.disconnect()
+
+if __name__ == '__main__':
+  main(sys.argv[1:])
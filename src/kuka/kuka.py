@@ -9,18 +9,46 @@ import copy
 import math
 import pybullet_data
 import time
+from .profiler import NULL_PROFILER
+from .ikService import IKGrid
+from .assets import AssetRegistry
 
 class Kuka:
 
-  def __init__(self, gripperInitOrn, urdfRootPath=pybullet_data.getDataPath(), timeStep=0.01): 
+  def __init__(self, baseInitPos=[-0.1,0.0,0.07], jointInitPos=None, gripperInitOrn=[0,0,0,1], \
+          fingerAForce=6, fingerBForce=5.5, fingerTipForce=6, \
+          urdfRootPath=pybullet_data.getDataPath(), timeStep=0.01, pybullet_client=p, profiler=NULL_PROFILER, \
+          jointTol=1e-2, eeTol=1e-3, stallSteps=None, maxSubSteps=None, subStepChunk=1, \
+          ikWarmStart=False, ikGrid=None, loadTray=True, origin=None, assets=None): 
+    self._p = pybullet_client
+    self.profiler = profiler
     self.urdfRootPath = urdfRootPath
+    #the AssetRegistry the model and the tray are loaded with
+    self.assets = assets if assets is not None else AssetRegistry.get(urdfRootPath)
     self.timeStep = timeStep
+    self.baseInitPos = baseInitPos
+    self.jointInitPos = jointInitPos
     self.gripperInitOrn = gripperInitOrn
     
     self.maxForce = 200.
-    self.fingerAForce = 6
-    self.fingerBForce = 5.5
-    self.fingerTipForce = 6
+    self.fingerAForce = fingerAForce
+    self.fingerBForce = fingerBForce
+    self.fingerTipForce = fingerTipForce
+    #setMotorScales scales the finger forces and the position gains from these
+    self._nominalForces = (fingerAForce, fingerBForce, fingerTipForce)
+    self._motorScales = (1., 1., 1., 1.)
+    #applyPosDiffAction and applyAction2 step until the joints (jointTol, summed absolute difference) or the end effector
+    #(eeTol) reach their targets, until they did not move for stallSteps steps in total, or until maxSubSteps steps,
+    #the settle checks run every subStepChunk steps
+    self.jointTol = jointTol
+    self.eeTol = eeTol
+    self.stallSteps = 1/self.timeStep if stallSteps is None else stallSteps
+    self.maxSubSteps = maxSubSteps
+    self.subStepChunk = subStepChunk
+    #the tasks load their own tray at the same pose, loadTray=False leaves out this duplicate
+    self.loadTray = loadTray
+    #origin of the workcell, the workspace limits and the observed end effector position are relative to it
+    self.origin = np.zeros(3) if origin is None else np.array(origin, dtype=np.float64)
     self.useInverseKinematics = 1
     self.useSimulation = 1
     self.useNullSpace = 1
@@ -36,33 +64,38 @@ class Kuka:
     self.rp=[0,0,0,0.5*math.pi,0,-math.pi*0.5*0.66,0]
     #joint damping coefficents
     self.jd=[0.00001,0.00001,0.00001,0.00001,0.00001,0.00001,0.00001,0.00001,0.00001,0.00001,0.00001,0.00001,0.00001,0.00001]
+    #the Cartesian controller keeps the gripper pointing down
+    self.downOrn = self._p.getQuaternionFromEuler([0,-math.pi,0])
+    #ikWarmStart starts every IK solve from the previous solution, ikGrid (an IKGrid or the file it was saved to)
+    #replaces the solve for the downward orientation inside the grid, see ikService
+    self.ikWarmStart = ikWarmStart
+    self.ikGrid = IKGrid.load(ikGrid) if isinstance(ikGrid, str) else ikGrid
+    self._lastIK = None
+    #the end effector link state read until the next physics step, see holdEndEffectorState
+    self._heldEEState = None
+    #the last position motor command of every joint as (targetPosition, force, positionGain, velocityGain),
+    #saveState does not store motor commands, restoreMotors sends them again
+    self.motorTargets = {}
     self.reset()
     
   def reset(self):
-    objects = p.loadSDF(os.path.join(self.urdfRootPath,"kuka_iiwa/kuka_with_gripper2.sdf"))
+    objects = self.assets.load(self._p, "kuka")
     self.kukaUid = objects[0]
-    #for i in range (p.getNumJoints(self.kukaUid)):
-    #  print(p.getJointInfo(self.kukaUid,i))
-    p.resetBasePositionAndOrientation(self.kukaUid,[-0.100000,0.000000,0.070000],[0.000000,0.000000,0.000000,1.000000])
-    self.jointPositions=[ 0.006418, 0.413184, -0.011401, -1.589317, 0.005379, 1.137684, -0.006539, 0.000048, -0.299912, 0.000000, -0.000043, 0.299960, 0.000000, -0.000200 ]
-
-    self.numJoints = p.getNumJoints(self.kukaUid)
-    for jointIndex in range (self.numJoints):
-      p.resetJointState(self.kukaUid,jointIndex,self.jointPositions[jointIndex])
-      p.setJointMotorControl2(self.kukaUid,jointIndex,p.POSITION_CONTROL,targetPosition=self.jointPositions[jointIndex],force=self.maxForce)
+    #for i in range (self._p.getNumJoints(self.kukaUid)):
+    #  print(self._p.getJointInfo(self.kukaUid,i))
+    self._p.resetBasePositionAndOrientation(self.kukaUid,self.baseInitPos,[0.000000,0.000000,0.000000,1.000000])
+    self.numJoints = self._p.getNumJoints(self.kukaUid)
     
-    self.trayUid = p.loadURDF(os.path.join(self.urdfRootPath,"tray/tray.urdf"), 0.640000,0.075000,-0.190000,0.000000,0.000000,1.000000,0.000000)
-    linkState = p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
-    self.endEffectorPos = np.array(linkState[0])
-    jointState = p.getJointState(self.kukaUid, 7)
-    self.endEffectorAngle = jointState[0]
+    self.trayUid = None
+    if self.loadTray:
+      self.trayUid = self.assets.load(self._p, "tray", [0.640000,0.075000,-0.190000], [0.000000,0.000000,1.000000,0.000000])
 
     self.motorNames = []
     self.motorIndices = []
     self.jointUpperLimit = []
     
     for i in range (self.numJoints):
-      jointInfo = p.getJointInfo(self.kukaUid,i)
+      jointInfo = self._p.getJointInfo(self.kukaUid,i)
       qIndex = jointInfo[3]
       upperLimit = jointInfo[9]
       if qIndex > -1:
@@ -74,35 +107,109 @@ class Kuka:
 
     self.jointUpperLimit = np.array(self.jointUpperLimit)
 
+    self._jointIndices = list(range(self.numJoints))
+    self._jointForces = [self.maxForce]*self.numJoints
+    self._velocityGains = [1.0]*self.numJoints
+    self._tipJoints = [7, 10, 13]
+    self._gripperJoints = [7, 8, 11, 10, 13]
+    self._setMotorGroups()
+    #the commands of the previous model are gone with it
+    self.motorTargets.clear()
+
+    self.resetState()
+
+  #put the joints back to the default pose without reloading the model, then move the arm to jointInitPos
+  def resetState(self, jointInitPos=None):
+    self._lastIK = None
+    self.setJointInitPos(jointInitPos)
+    for jointIndex in range (self.numJoints):
+      self._p.resetJointState(self.kukaUid,jointIndex,self.jointPositions[jointIndex])
+    self.setMotors(self._jointIndices,self.jointPositions,self._jointForces,self._positionGains,self._velocityGains)
+    
+    linkState = self._p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
+    self.endEffectorPos = np.array(linkState[0])
+    jointState = self._p.getJointState(self.kukaUid, 7)
+    self.endEffectorAngle = jointState[0]
+
+    if self.jointInitPos is not None:
+      self.initState(self.jointInitPos, False)
+
+  #joint groups of setMotors with their forces and gains: the arm, the arm under the Cartesian controller,
+  #the gripper joints of applyAction2 (end effector angle and finger tips) and of applyAction (with the fingers)
+  def _setMotorGroups(self):
+    positionGain = self._motorScales[3]
+    self._positionGains = [0.1*positionGain]*self.numJoints
+    self._armGains = [0.03*positionGain]*(self.kukaEndEffectorIndex+1)
+    self._tipForces = [self.maxForce, self.fingerTipForce, self.fingerTipForce]
+    self._gripperForces = [self.maxForce, self.fingerAForce, self.fingerBForce, self.fingerTipForce, self.fingerTipForce]
+
+  #the finger forces and the position gains of the motor commands as factors on their nominal values, e.g. for
+  #domain randomization. The motors get them with their next command.
+  def setMotorScales(self, fingerAForce=1., fingerBForce=1., fingerTipForce=1., positionGain=1.):
+    scales = (fingerAForce, fingerBForce, fingerTipForce, positionGain)
+    if scales == self._motorScales:
+      return False
+    self._motorScales = scales
+    self.fingerAForce = self._nominalForces[0]*fingerAForce
+    self.fingerBForce = self._nominalForces[1]*fingerBForce
+    self.fingerTipForce = self._nominalForces[2]*fingerTipForce
+    self._setMotorGroups()
+    return True
+
+  def setJointInitPos(self, jointInitPos=None):
+    if jointInitPos is not None:
+      self.jointInitPos = jointInitPos
+    self.jointPositions=[ 0.006418, 0.413184, -0.011401, -1.589317, 0.005379, 1.137684, -0.006539, 0.000048, -0.299912, 0.000000, -0.000043, 0.299960, 0.000000, -0.000200 ]
+    #the gripper starts from the requested finger joints, the arm is moved there by initState
+    if self.jointInitPos is not None:
+      for i in range(self.kukaEndEffectorIndex+1, len(self.jointInitPos)):
+        self.jointPositions[i] = self.jointInitPos[i]
+
+  #a restored snapshot holds neither the motor targets nor the end effector targets,
+  #set them as if the arm had just been moved to jointPos by applyPosDiffAction
+  def syncState(self, jointPos):
+    for i in range(len(jointPos)):
+      self.jointPositions[i] = jointPos[i]
+    armJoints = self.kukaEndEffectorIndex+1
+    armTargetPos = np.clip(np.array(self.jointPositions[:armJoints]), -self.jointUpperLimit[:armJoints], self.jointUpperLimit[:armJoints])
+    targetPos = list(armTargetPos)+self.jointPositions[armJoints:self.numJoints]
+    self.setMotors(self._jointIndices,targetPos,self._jointForces,self._positionGains,self._velocityGains)
+
+    linkState = self._p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
+    self.endEffectorPos = np.array(linkState[0])
+    jointState = self._p.getJointState(self.kukaUid, 7)
+    self.endEffectorAngle = jointState[0]
+
+  #puts the joints at jointPos without stepping the simulation, instead of moving the arm there
+  def resetJoints(self, jointPos):
+    self._lastIK = None
+    for i in range(len(jointPos)):
+      self._p.resetJointState(self.kukaUid,i,jointPos[i])
+    self.syncState(jointPos)
+
   def initState(self, jointPos, renders):
     for i in range(len(jointPos)):
         self.jointPositions[i] = jointPos[i]
 
-    curJointStates = list(p.getJointStates(self.kukaUid, range(self.kukaEndEffectorIndex+1)))
-    curJointPos = []
-    for state in curJointStates:
-        curJointPos.append(list(state)[0])
+    curJointPos = self.getJointPos(self.kukaEndEffectorIndex+1)
 
     jointDiff = [self.jointPositions[i]-curJointPos[i] for i in range(len(curJointPos))]
     self.applyPosDiffAction(jointDiff, renders)
 
-    linkState = p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
+    linkState = self._p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
     self.endEffectorPos = np.array(linkState[0])
-    jointState = p.getJointState(self.kukaUid, 7)
+    jointState = self._p.getJointState(self.kukaUid, 7)
     self.endEffectorAngle = jointState[0]
 
   def setGoodInitStateEE(self, jointPoses, renders):
-    curJointStates = list(p.getJointStates(self.kukaUid, range(self.kukaEndEffectorIndex+1)))
-    curJointPos = []
-    for state in curJointStates:
-        curJointPos.append(list(state)[0])
+    curJointPos = self.getJointPos(self.kukaEndEffectorIndex+1)
 
     jointDiff = [jointPoses[i]-curJointPos[i] for i in range(len(curJointPos))]
     self.applyPosDiffAction(jointDiff, renders)
 
-    linkState = p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
+    linkState = self._p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
     self.endEffectorPos = np.array(linkState[0])
-    jointState = p.getJointState(self.kukaUid, 7)
+    jointState = self._p.getJointState(self.kukaUid, 7)
     self.endEffectorAngle = jointState[0]
 
   def getActionDimension(self):
@@ -111,27 +218,123 @@ class Kuka:
     return 6 #position x,y,z and roll/pitch/yaw euler angles of end effector
 
   def getObservationDimension(self):
-    return len(self.getObservation())
+    return self.kukaEndEffectorIndex+1+6
 
-  def getObservation(self):
-    observation = []
+  #positions of the first numJoints joints, read with one getJointStates call
+  def getJointPos(self, numJoints):
+    jointStates = self._p.getJointStates(self.kukaUid, range(numJoints))
+    return np.array([state[0] for state in jointStates])
+
+  #writes the observation into out if given, so the envs can reuse one buffer,
+  #the end effector link state is kept in endEffectorState for the task observations
+  def getObservation(self, out=None):
+    if out is None:
+      out = np.zeros(self.getObservationDimension(), dtype=np.float32)
+    numJoints = self.kukaEndEffectorIndex+1
 
     #calculate current position
-    jointStates = list(p.getJointStates(self.kukaUid, range(self.kukaEndEffectorIndex+1)))
-    jointPos = []
-    for state in jointStates:
-      jointPos.append(list(state)[0])
-
-    state = p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
-    pos = state[0]
-    orn = state[1]
-    euler = p.getEulerFromQuaternion(orn)
-
-    observation.extend(jointPos)
-    observation.extend(list(pos))
-    observation.extend(list(euler))
+    jointStates = self._p.getJointStates(self.kukaUid, range(numJoints))
+    out[:numJoints] = [state[0] for state in jointStates]
+
+    state = self.getEndEffectorState()
+    self.endEffectorState = state
+    out[numJoints:numJoints+3] = np.subtract(state[0], self.origin)
+    out[numJoints+3:numJoints+6] = self._p.getEulerFromQuaternion(state[1])
     
-    return observation
+    return out
+
+  #restoreState recomputes the link frames, the frames stepSimulation leaves are from before its last step.
+  #A restored arm reads the end effector state the cloned one read until the next physics step, None lets go of it.
+  def holdEndEffectorState(self, state):
+    self._heldEEState = state
+
+  def getEndEffectorState(self):
+    if self._heldEEState is not None:
+      return self._heldEEState
+    return self._p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
+
+  #orn=None is the downward orientation of the Cartesian controller
+  def calculateIK(self, pos, orn=None):
+    with self.profiler.section('ik'):
+      if orn is None:
+        if self.ikGrid is not None and self.ikGrid.contains(np.subtract(pos, self.origin)):
+          return self.ikGrid.interpolate(np.subtract(pos, self.origin))
+        orn = self.downOrn
+      kwargs = {}
+      if self.ikWarmStart and self._lastIK is not None:
+        kwargs['currentPositions'] = self._lastIK
+      if (self.useNullSpace==1):
+        if (self.useOrientation==1):
+          jointPoses = self._p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos,orn,self.ll,self.ul,self.jr,self.rp,**kwargs)
+        else:
+          jointPoses = self._p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos,lowerLimits=self.ll, upperLimits=self.ul, jointRanges=self.jr, restPoses=self.rp,**kwargs)
+      else:
+        if (self.useOrientation==1):
+          jointPoses = self._p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos,orn,jointDamping=self.jd,**kwargs)
+        else:
+          jointPoses = self._p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos,**kwargs)
+      self._lastIK = jointPoses
+      return jointPoses
+
+  def setMotor(self, jointIndex, targetPosition, force, positionGain=0.1, velocityGain=1.0):
+    return self.setMotors([jointIndex],[targetPosition],[force],[positionGain],[velocityGain])
+
+  #Position commands for a group of joints in one setJointMotorControlArray call, the force and gain sequences may be
+  #longer than jointIndices. The motors keep their commands, so the call is skipped if motorTargets already holds the
+  #same command for every joint of the group. Returns whether the commands were sent.
+  def setMotors(self, jointIndices, targetPositions, forces, positionGains, velocityGains):
+    commands = [(float(target), force, positionGain, velocityGain) for target, force, positionGain, velocityGain \
+            in zip(targetPositions, forces, positionGains, velocityGains)]
+    motorTargets = self.motorTargets
+    if all(motorTargets.get(jointIndex) == command for jointIndex, command in zip(jointIndices, commands)):
+      return False
+    jointIndices = jointIndices[:len(commands)]
+    targetPositions, forces, positionGains, velocityGains = zip(*commands)
+    self._p.setJointMotorControlArray(self.kukaUid, jointIndices, p.POSITION_CONTROL, targetPositions=targetPositions, \
+            forces=forces, positionGains=positionGains, velocityGains=velocityGains)
+    motorTargets.update(zip(jointIndices, commands))
+    return True
+
+  def restoreMotors(self, motorTargets):
+    self.motorTargets.clear()
+    self.motorTargets.update(motorTargets)
+    jointIndices = sorted(motorTargets)
+    targets, forces, positionGains, velocityGains = zip(*[motorTargets[j] for j in jointIndices])
+    self._p.setJointMotorControlArray(self.kukaUid, jointIndices, p.POSITION_CONTROL, targetPositions=targets, \
+            forces=forces, positionGains=positionGains, velocityGains=velocityGains)
+
+  #moves the end effector target by (dx, dy, dz, da) of motorCommands within the workspace and returns it,
+  #state is the current end effector link state if the caller has already read it. A caller that moves the target
+  #every physics step passes the tickScale of its step rate, the nudge up from below 0.10 m is written for 240 Hz.
+  def moveEndEffector(self, motorCommands, state=None, tickScale=1.):
+    dx = motorCommands[0]
+    dy = motorCommands[1]
+    dz = motorCommands[2]
+    da = motorCommands[3]
+
+    if state is None:
+      state = self.getEndEffectorState()
+    actualEndEffectorPos = state[0]
+
+    originX, originY = self.origin[0], self.origin[1]
+    self.endEffectorPos[0] = self.endEffectorPos[0]+dx
+    if (self.endEffectorPos[0]>originX+0.75):
+      self.endEffectorPos[0]=originX+0.75
+    if (self.endEffectorPos[0]<originX+0.45):
+      self.endEffectorPos[0]=originX+0.45
+    self.endEffectorPos[1] = self.endEffectorPos[1]+dy
+    if (self.endEffectorPos[1]<originY-0.22):
+      self.endEffectorPos[1]=originY-0.22
+    if (self.endEffectorPos[1]>originY+0.22):
+      self.endEffectorPos[1]=originY+0.22
+
+    if (dz>0 or actualEndEffectorPos[2]>0.10):
+      self.endEffectorPos[2] = self.endEffectorPos[2]+dz
+    if (actualEndEffectorPos[2]<0.10):
+      self.endEffectorPos[2] = self.endEffectorPos[2]+0.0001*tickScale
+
+    self.endEffectorAngle = self.endEffectorAngle + da
+    return self.endEffectorPos
 
   def applyAction(self, motorCommands):
     
@@ -139,193 +342,146 @@ class Kuka:
     #print (self.numJoints)
     if (self.useInverseKinematics):
       
-      dx = motorCommands[0]
-      dy = motorCommands[1]
-      dz = motorCommands[2]
-      da = motorCommands[3]
       fingerAngle = motorCommands[4]
-      
-      state = p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
-      actualEndEffectorPos = state[0]
-      #print("pos[2] (getLinkState(kukaEndEffectorIndex)")
-      #print(actualEndEffectorPos[2])
-      
-      self.endEffectorPos[0] = self.endEffectorPos[0]+dx
-      if (self.endEffectorPos[0]>0.75):
-        self.endEffectorPos[0]=0.75
-      if (self.endEffectorPos[0]<0.45):
-        self.endEffectorPos[0]=0.45
-      self.endEffectorPos[1] = self.endEffectorPos[1]+dy
-      if (self.endEffectorPos[1]<-0.22):
-        self.endEffectorPos[1]=-0.22
-      if (self.endEffectorPos[1]>0.22):
-        self.endEffectorPos[1]=0.22
-      
-      #print ("self.endEffectorPos[2]")
-      #print (self.endEffectorPos[2])
-      #print("actualEndEffectorPos[2]")
-      #print(actualEndEffectorPos[2])
-      if (dz>0 or actualEndEffectorPos[2]>0.10):
-        self.endEffectorPos[2] = self.endEffectorPos[2]+dz
-      if (actualEndEffectorPos[2]<0.10):
-        self.endEffectorPos[2] = self.endEffectorPos[2]+0.0001
-    
-     
-      self.endEffectorAngle = self.endEffectorAngle + da
-      pos = self.endEffectorPos
-      orn = p.getQuaternionFromEuler([0,-math.pi,0]) # -math.pi,yaw])
-      if (self.useNullSpace==1):
-        if (self.useOrientation==1):
-          jointPoses = p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos,orn,self.ll,self.ul,self.jr,self.rp)
-        else:
-          jointPoses = p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos,lowerLimits=self.ll, upperLimits=self.ul, jointRanges=self.jr, restPoses=self.rp)
-      else:
-        if (self.useOrientation==1):
-          jointPoses = p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos,orn,jointDamping=self.jd)
-        else:
-          jointPoses = p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos)
+      pos = self.moveEndEffector(motorCommands)
+      jointPoses = self.calculateIK(pos)
    
       #print("jointPoses")
       #print("self.kukaEndEffectorIndex")
       #print(self.kukaEndEffectorIndex)
       if (self.useSimulation):
-        for i in range (self.kukaEndEffectorIndex+1):
-          #print(i)
-          p.setJointMotorControl2(bodyIndex=self.kukaUid,jointIndex=i,controlMode=p.POSITION_CONTROL,targetPosition=jointPoses[i],targetVelocity=0,force=self.maxForce,positionGain=0.03,velocityGain=1)
+        self.setArmMotors(jointPoses)
       else:
         #reset the joint state (ignoring all dynamics, not recommended to use during simulation)
         for i in range (self.numJoints):
-          p.resetJointState(self.kukaUid,i,jointPoses[i])
+          self._p.resetJointState(self.kukaUid,i,jointPoses[i])
       #fingers
-      p.setJointMotorControl2(self.kukaUid,7,p.POSITION_CONTROL,targetPosition=self.endEffectorAngle,force=self.maxForce)
-      p.setJointMotorControl2(self.kukaUid,8,p.POSITION_CONTROL,targetPosition=-fingerAngle,force=self.fingerAForce)
-      p.setJointMotorControl2(self.kukaUid,11,p.POSITION_CONTROL,targetPosition=fingerAngle,force=self.fingerBForce)
-      
-      p.setJointMotorControl2(self.kukaUid,10,p.POSITION_CONTROL,targetPosition=0,force=self.fingerTipForce)
-      p.setJointMotorControl2(self.kukaUid,13,p.POSITION_CONTROL,targetPosition=0,force=self.fingerTipForce)
+      self.setMotors(self._gripperJoints,[self.endEffectorAngle,-fingerAngle,fingerAngle,0,0],self._gripperForces, \
+              self._positionGains,self._velocityGains)
     else:
-      for action in range (len(motorCommands)):
-        motor = self.motorIndices[action]
-        p.setJointMotorControl2(self.kukaUid,motor,p.POSITION_CONTROL,targetPosition=motorCommands[action],force=self.maxForce)
+      self.setJointMotors(motorCommands)
+
+  #arm joint targets of the Cartesian controller
+  def setArmMotors(self, jointPoses):
+    armJoints = self.kukaEndEffectorIndex+1
+    return self.setMotors(self._jointIndices[:armJoints],jointPoses[:armJoints],self._jointForces,self._armGains, \
+            self._velocityGains)
+
+  #targets for the first len(targetPos) motors
+  def setJointMotors(self, targetPos):
+    return self.setMotors(self.motorIndices[:len(targetPos)],targetPos,self._jointForces,self._positionGains, \
+            self._velocityGains)
 
   def applyAction2(self, motorCommands, renders):
-    
+    return self._settle(self.action2Settle(motorCommands), renders)
+
+  #The settle loops of applyAction2 and applyPosDiffAction as generators: they set the motor targets and yield the
+  #number of physics steps they want next, the caller steps the simulation and sends back the number of steps taken.
+  #They return the number of physics steps it took the arm to settle. KukaContiMultiEnv runs the loops of several
+  #arms in one world this way.
+  def action2Settle(self, motorCommands):
     if (self.useInverseKinematics):
       
-      dx = motorCommands[0]
-      dy = motorCommands[1]
-      dz = motorCommands[2]
-      da = motorCommands[3]
-      
-      state = p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
+      state = self.getEndEffectorState()
       actualEndEffectorPos = state[0]
-      
-      self.endEffectorPos[0] = self.endEffectorPos[0]+dx
-      if (self.endEffectorPos[0]>0.75):
-        self.endEffectorPos[0]=0.75
-      if (self.endEffectorPos[0]<0.45):
-        self.endEffectorPos[0]=0.45
-      self.endEffectorPos[1] = self.endEffectorPos[1]+dy
-      if (self.endEffectorPos[1]<-0.22):
-        self.endEffectorPos[1]=-0.22
-      if (self.endEffectorPos[1]>0.22):
-        self.endEffectorPos[1]=0.22
-      
-      if (dz>0 or actualEndEffectorPos[2]>0.10):
-        self.endEffectorPos[2] = self.endEffectorPos[2]+dz
-      if (actualEndEffectorPos[2]<0.10):
-        self.endEffectorPos[2] = self.endEffectorPos[2]+0.0001
-    
-     
-      self.endEffectorAngle = self.endEffectorAngle + da
-      pos = self.endEffectorPos
-      orn = p.getQuaternionFromEuler([0,-math.pi,0]) # -math.pi,yaw])
-      if (self.useNullSpace==1):
-        if (self.useOrientation==1):
-          jointPoses = p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos,orn,self.ll,self.ul,self.jr,self.rp)
-        else:
-          jointPoses = p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos,lowerLimits=self.ll, upperLimits=self.ul, jointRanges=self.jr, restPoses=self.rp)
-      else:
-        if (self.useOrientation==1):
-          jointPoses = p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos,orn,jointDamping=self.jd)
-        else:
-          jointPoses = p.calculateInverseKinematics(self.kukaUid,self.kukaEndEffectorIndex,pos)
+      pos = self.moveEndEffector(motorCommands, state)
+      jointPoses = self.calculateIK(pos)
 
-      initJointState = p.getJointStates(self.kukaUid, range(self.kukaEndEffectorIndex+1))
-      initJointPos = np.array([state[0] for state in initJointState])
+      initJointPos = self.getJointPos(self.kukaEndEffectorIndex+1)
+      #a target too far away from the current joint positions is not followed
+      ikJump = np.abs(np.array(jointPoses[:self.kukaEndEffectorIndex+1])-initJointPos).sum()
    
       prevEndEffectorPos = np.array(actualEndEffectorPos)
-      jointState = p.getJointState(self.kukaUid, 7)
+      jointState = self._p.getJointState(self.kukaUid, 7)
       prevJointPos = jointState[0]
       stuckNum = 0
+      physicsSteps = 0
       while True:
         #Calculate the current position
-        linkState = p.getLinkState(self.kukaUid,self.kukaEndEffectorIndex)
+        linkState = self.getEndEffectorState()
         actualEndEffectorPos = np.array(linkState[0])
-        jointState = p.getJointState(self.kukaUid, 7)
+        jointState = self._p.getJointState(self.kukaUid, 7)
         actualJointPos = jointState[0]
-        if sum(abs(np.array(jointPoses[:self.kukaEndEffectorIndex+1])-initJointPos)) > 0.3:
+        if ikJump > 0.3:
           break
         #Calculate the difference between the target position
         prevJointDiff = abs(actualJointPos-prevJointPos)
         jointDiff = abs(actualJointPos-self.endEffectorAngle)
-        if np.linalg.norm(prevEndEffectorPos-actualEndEffectorPos) <= 1e-3 and prevJointDiff <= 1e-3:
-          stuckNum += 1
-        if (np.linalg.norm(self.endEffectorPos-actualEndEffectorPos) <= 1e-3 and jointDiff <= 1e-3) or stuckNum >= 1/self.timeStep:
+        if np.linalg.norm(prevEndEffectorPos-actualEndEffectorPos) <= self.eeTol and prevJointDiff <= self.eeTol:
+          stuckNum += self.subStepChunk
+        if (np.linalg.norm(self.endEffectorPos-actualEndEffectorPos) <= self.eeTol and jointDiff <= self.eeTol) or stuckNum >= self.stallSteps:
+          break
+        if self.maxSubSteps is not None and physicsSteps >= self.maxSubSteps:
           break
 
         if (self.useSimulation):
-          for i in range (self.kukaEndEffectorIndex+1):
-            p.setJointMotorControl2(\
-              bodyIndex=self.kukaUid,jointIndex=i,controlMode=p.POSITION_CONTROL,targetPosition=jointPoses[i],targetVelocity=0,force=self.maxForce,positionGain=0.03,velocityGain=1)
+          self.setArmMotors(jointPoses)
         else:
           for i in range(self.numJoints):
-            p.resetJointState(self.kukaUid,i,jointPoses[i])
+            self._p.resetJointState(self.kukaUid,i,jointPoses[i])
         #fingers
-        p.setJointMotorControl2(self.kukaUid,7,p.POSITION_CONTROL,targetPosition=self.endEffectorAngle,force=self.maxForce)
-      
-        p.setJointMotorControl2(self.kukaUid,10,p.POSITION_CONTROL,targetPosition=0,force=self.fingerTipForce)
-        p.setJointMotorControl2(self.kukaUid,13,p.POSITION_CONTROL,targetPosition=0,force=self.fingerTipForce)
+        self.setMotors(self._tipJoints,[self.endEffectorAngle,0,0],self._tipForces,self._positionGains,self._velocityGains)
 
-        p.stepSimulation()
-        if renders:
-          time.sleep(self.timeStep)
+        physicsSteps += yield self._chunkSize(physicsSteps)
         prevEndEffectorPos = actualEndEffectorPos
         prevJointPos = actualJointPos
 
       self.endEffectorPos = actualEndEffectorPos
       self.endEffectorAngle = actualJointPos
+      return physicsSteps
       
     else:
-      for action in range (len(motorCommands)):
-        motor = self.motorIndices[action]
-        p.setJointMotorControl2(self.kukaUid,motor,p.POSITION_CONTROL,targetPosition=motorCommands[action],force=self.maxForce)
+      self.setJointMotors(motorCommands)
+      return 0
      
+  #subStepChunk steps between two settle checks, without going over maxSubSteps
+  def _chunkSize(self, physicsSteps):
+    if self.maxSubSteps is not None:
+      return min(self.subStepChunk, self.maxSubSteps-physicsSteps)
+    return self.subStepChunk
+
+  #runs a settle loop on its own
+  def _settle(self, settle, renders):
+    try:
+      numSteps = next(settle)
+      while True:
+        numSteps = settle.send(self._stepChunk(numSteps, renders))
+    except StopIteration as stop:
+      return stop.value
+
+  def _stepChunk(self, numSteps, renders):
+    if numSteps > 0:
+      self._heldEEState = None
+    for _ in range(numSteps):
+      self._p.stepSimulation()
+      if renders:
+        time.sleep(self.timeStep)
+    self.profiler.count('stepSimulation', numSteps)
+    return numSteps
+
   #directly apply position difference commands
   #handle obstacle avoidance
+  #returns the number of physics steps it took the arm to settle
   def applyPosDiffAction(self, motorCommands, renders):
+    return self._settle(self.posDiffSettle(motorCommands), renders)
+
+  def posDiffSettle(self, motorCommands):
     #calculate the target position
-    jointStates = list(p.getJointStates(self.kukaUid, range(len(motorCommands))))
-    targetPos = []
-    for state in jointStates:
-      targetPos.append(list(state)[0])
-    prevPos = np.array(targetPos)
+    targetPos = self.getJointPos(len(motorCommands))
+    prevPos = targetPos
     stuckNum = 0
-    targetPos = np.clip(np.array(targetPos)+np.array(motorCommands), -self.jointUpperLimit[:len(targetPos)], self.jointUpperLimit[:len(targetPos)])
+    physicsSteps = 0
+    targetPos = np.clip(targetPos+np.array(motorCommands), -self.jointUpperLimit[:len(targetPos)], self.jointUpperLimit[:len(targetPos)])
     while True:
       #calculate current position
-      jointStates = list(p.getJointStates(self.kukaUid, range(len(motorCommands))))
-      jointPos = []
-      for state in jointStates:
-        jointPos.append(list(state)[0])
-      if sum(abs(np.array(jointPos)-prevPos)) <= 1e-2:
-        stuckNum += 1
-      if sum(abs(targetPos-np.array(jointPos))) <= 1e-2 or stuckNum >= 1/self.timeStep:
+      jointPos = self.getJointPos(len(motorCommands))
+      if np.abs(jointPos-prevPos).sum() <= self.jointTol:
+        stuckNum += self.subStepChunk
+      if np.abs(targetPos-jointPos).sum() <= self.jointTol or stuckNum >= self.stallSteps:
         break
-      for action in range (len(motorCommands)):
-        motor = self.motorIndices[action]
-        p.setJointMotorControl2(self.kukaUid,motor,p.POSITION_CONTROL,targetPosition=targetPos[action],force=self.maxForce)
-      p.stepSimulation()
-      if renders:
-        time.sleep(self.timeStep)
-      prevPos = np.array(jointPos)
+      if self.maxSubSteps is not None and physicsSteps >= self.maxSubSteps:
+        break
+      self.setJointMotors(targetPos)
+      physicsSteps += yield self._chunkSize(physicsSteps)
+      prevPos = jointPos
+    return physicsSteps
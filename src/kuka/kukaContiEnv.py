@@ -1,99 +1,698 @@
-import os
 import gym
 from gym import spaces
 from gym.utils import seeding
 import numpy as np
 import pybullet as p
+from pybullet_utils import bullet_client
 from . import kuka
-import random
+from .startStateCache import StartStateCache
+from .statePool import StatePool
+from .profiler import StepProfiler, NULL_PROFILER
+from .camera import Camera
+from .ikService import IKGrid
+from .scriptedPhase import ScriptedPhase, StableOutcome
+from .assets import AssetRegistry
+from .randomization import DomainRandomizer, perturbView
 import pybullet_data
 
 RENDER_HEIGHT = 720
 RENDER_WIDTH = 960
 
+#scene complexity profiles: 'eval' is the full scene, 'train_fast' leaves out the ground plane (nothing reaches
+#it) and the duplicate tray of Kuka, replaces the table meshes with one box and solves with fewer iterations
+FIDELITY_PROFILES = {
+    'eval': {'numSolverIterations': 150, 'plane': True, 'tableMesh': True, 'kukaTray': True},
+    'train_fast': {'numSolverIterations': 50, 'plane': False, 'tableMesh': False, 'kukaTray': False},
+}
+
+#collision filter of the cells of KukaContiMultiEnv: a group bit per cell (cells 30 apart share one) and a bit for
+#every link with mass, static links only collide with those like in a world of their own
+CELL_GROUPS = (1 << 30)-1
+DYNAMIC_GROUP = 1 << 30
+
 class KukaContiEnv(gym.Env):
   metadata = {
       'render.modes': ['human', 'rgb_array'],
-      'video.frames_per_second' : 50
+      'render_modes': ['human', 'rgb_array'],
+      'video.frames_per_second' : 50,
+      'render_fps': 50,
   }
+  #the TaskSpec of the task, see taskSpec.py. reset, termination, reward and the observation are written for it.
+  task = None
+  #the AssetRegistry names the task loads, checked when the env is made
+  assetNames = ('plane', 'table', 'tray', 'kuka')
+  #arm joint positions, end effector position and euler angles, object position and euler angles in the end effector frame
+  observationDim = 7+6+6
 
   def __init__(self,
                urdfRoot=pybullet_data.getDataPath(),
                actionRepeat=1,
                isEnableSelfCollision=True,
-               renders=False):
-    self._timeStep = 1./240.
+               renders=False,
+               fastReset=False,
+               startStateCacheSize=0,
+               startStateDir=None,
+               copyObs=True,
+               settleParams=None,
+               profile=False,
+               cameraParams=None,
+               ikParams=None,
+               terminalParams=None,
+               statePoolSize=256,
+               rigParams=None,
+               fidelity='eval',
+               timeStep=1./240.,
+               numSubSteps=0,
+               numSolverIterations=None,
+               cell=None,
+               lazy=False,
+               randomParams=None):
+    if fidelity not in FIDELITY_PROFILES:
+      raise ValueError('fidelity must be one of %s, not %s' % (', '.join(FIDELITY_PROFILES), fidelity))
+    self.fidelity = fidelity
+    self._fidelityParams = FIDELITY_PROFILES[fidelity]
+    #every stepSimulation advances timeStep seconds in numSubSteps solver steps (0 is one step),
+    #numSolverIterations overrides the one of the fidelity profile
+    self._timeStep = timeStep
+    self._numSubSteps = numSubSteps
+    self._numSolverIterations = numSolverIterations if numSolverIterations is not None else self._fidelityParams['numSolverIterations']
+    #the terminal phases are written for 240 Hz, a physics step is tickScale of those steps long
+    self._tickScale = 240.*timeStep
     self._urdfRoot = urdfRoot
+    #asset files resolved once per process, assets.report() has their load times
+    self.assets = AssetRegistry.get(urdfRoot)
+    self.assets.validate(self.task.assetNames if self.task is not None else self.assetNames)
+    #every step applies and settles the action actionRepeat times before it observes
     self._actionRepeat = actionRepeat
     self._isEnableSelfCollision = isEnableSelfCollision
     self._observation = []
+    #observations are assembled in one preallocated buffer, copyObs=False hands out the buffer itself
+    self._obsBuffer = None
+    self._copyObs = copyObs
+    #keyword arguments for Kuka that control how long an action may step the simulation
+    self._settleParams = settleParams if settleParams is not None else {}
+    #ikWarmStart and ikGrid for Kuka, a grid file is loaded once here instead of on every reset
+    self._ikParams = dict(ikParams) if ikParams is not None else {}
+    if isinstance(self._ikParams.get('ikGrid'), str):
+      self._ikParams['ikGrid'] = IKGrid.load(self._ikParams['ikGrid'])
+    #checkEvery, window and stopOnSuccess to end the terminal phase early once its outcome is decided,
+    #None runs it to the end
+    self._terminalParams = terminalParams
+    #profile=True records the time spent in every part of step, see profiler.StepProfiler
+    self.profiler = StepProfiler() if profile else NULL_PROFILER
     self._envStepCounter = 0
     self._renders = renders
     self._width = 341
     self._height = 256
     self.terminated = 0
-    self.gripper_closed = 0
-    self._p = p
-    if self._renders:
-      cid = p.connect(p.SHARED_MEMORY)
-      if (cid<0):
-         cid = p.connect(p.GUI)
-      p.resetDebugVisualizerCamera(1.3,180,-41,[0.52,-0.2,-0.33])
-    else:
-      p.connect(p.DIRECT)
+    self.gripper_closed = self.task.gripperClosed if self.task is not None else 0
+    #with fastReset the static scene is loaded once and later resets restore a saved snapshot of it
+    self._fastReset = fastReset
+    self._stateId = None
+    #(pybullet_client, index, origin) when the env is workcell index of a world shared with other envs, see
+    #KukaContiMultiEnv. A cell always resets fast, from the poses its bodies were loaded with.
+    self._cell = cell
+    self._cellBodies = None
+    self._pendingPhase = None
+    if cell is not None:
+      self._fastReset = True
+    #the contact pairs are sorted in an env that restores snapshots, see _resetSimulation
+    self._sortPairs = self._fastReset
+    self._startStateCacheSize = startStateCacheSize
+    self._startStateDir = startStateDir
+    self._statePoolSize = statePoolSize
+    self._cameraParams = cameraParams or {}
+    self._rigParams = rigParams
+    #the physics client and what is bound to it, made by _connect
+    self._p = None
+    self._camera = None
+    self.cameraRig = None
+    self._startStateCache = None
+    self._statePool = None
 
     self.viewMat = [1.0, 0.0, -0.0, 0.0, -0.0, 0.9998477101325989, -0.017452415078878403, 0.0, 0.0, 0.017452415078878403, \
             0.9998477101325989, 0.0, -0.7200000286102295, 0.20572884380817413, -1.6235408782958984, 1.0]
     self.projMatrix = [0.69921875, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, -1.0000200271606445, -1.0, 0.0, 0.0, \
             -0.02000020071864128, 0.0]
+    if cell is not None:
+      #the same view of the cell, the matrices are column major
+      translation = np.eye(4)
+      translation[:3, 3] = -np.asarray(cell[2], dtype=np.float64)
+      self.viewMat = (np.array(self.viewMat).reshape(4, 4).T.dot(translation)).T.flatten().tolist()
 
+    #ranges, batch size and log of the domain randomization, see randomization.DomainRandomizer. The parameters of
+    #the episode are in episodeParams.
+    self._randomizer = DomainRandomizer(**randomParams) if randomParams is not None else None
+    self.episodeParams = {}
+    self._objectScales = {}
     self._seed()
-    self.reset()
-    observationDim = len(self.getExtendedObservation())
+    #lazy=True leaves connecting and loading the scene to the first reset, which makes creating an env cheap,
+    #e.g. before forking a pool of workers. The spaces do not depend on the scene.
+    if not lazy:
+      self.reset()
     
-    observation_high = np.array([np.finfo(np.float32).max] * observationDim)    
+    observation_high = np.array([np.finfo(np.float32).max] * self.observationDim)    
     action_high = 0.2 + np.zeros(7)
     self.action_space = spaces.Box(-action_high, action_high) #continuous action
     self.observation_space = spaces.Box(-observation_high, observation_high)
-    self.img_observation_space = spaces.Box(low=0, high=255, shape=(self._height, self._width, 4))
+    self.img_observation_space = spaces.Box(low=0, high=255, shape=Camera.imageShape(self._width, self._height, \
+            **self._cameraParams), dtype=np.uint8)
     self.viewer = None
 
+  #every env owns its own physics client so that several envs can live in one process, a cell uses the one of its world
+  def _connect(self):
+    if self._cell is not None:
+      self._p = self._cell[0]
+    elif self._renders:
+      self._p = bullet_client.BulletClient(connection_mode=p.GUI)
+      self._p.resetDebugVisualizerCamera(1.3,180,-41,[0.52,-0.2,-0.33])
+    else:
+      self._p = bullet_client.BulletClient(connection_mode=p.DIRECT)
+
+    #renderer, extra channels, resolution and render frequency of getImgObservation, see camera.Camera
+    self._camera = Camera(self._p, self._width, self._height, self.viewMat, self.projMatrix, **self._cameraParams)
+
+    #fixed cameras rendered every renderEvery steps and written to disk in the background, see cameraRig.CameraRig
+    if self._rigParams is not None:
+      from .cameraRig import CameraRig
+      self.cameraRig = CameraRig(self._p, **self._rigParams)
+
+    #settled start states are restored on top of the fast reset snapshot, so the cache needs fastReset
+    #and saveState covers the whole world, so cells have no cache
+    if self._fastReset and self._cell is None and (self._startStateCacheSize > 0 or self._startStateDir is not None):
+      self._startStateCache = StartStateCache(self._p, maxSize=self._startStateCacheSize, directory=self._startStateDir)
+
+    #snapshots taken by cloneState
+    self._statePool = StatePool(self._p, maxSize=self._statePoolSize)
+
   def __del__(self):
-    p.disconnect()
+    self.close()
+
+  def close(self):
+    if getattr(self, 'cameraRig', None) is not None:
+      self.cameraRig.close()
+      self.cameraRig = None
+    if getattr(self, '_p', None) is not None:
+      #the world of a cell belongs to KukaContiMultiEnv
+      if getattr(self, '_cell', None) is None:
+        self._p.disconnect()
+      self._p = None
+
+  def _resetSimulation(self):
+    if self._p is None:
+      self._connect()
+    if self._cell is None:
+      self._p.resetSimulation()
+    #restoreState leaves the contact pairs of the rollout before in place, sorted they are solved in the same order
+    #whatever came before, so a fast reset replays the same episode. A cold reset starts without pairs and keeps
+    #the unsorted default of pybullet.
+    self._p.setPhysicsEngineParameter(numSolverIterations=self._numSolverIterations, numSubSteps=self._numSubSteps, \
+            deterministicOverlappingPairs=int(bool(self._sortPairs)))
+    self._p.setTimeStep(self._timeStep)
+    #resetSimulation drops all saved states
+    self._stateId = None
+    self._camera.invalidate()
+    #and the loaded bodies come with their nominal dynamics
+    if self._randomizer is not None:
+      self._randomizer.invalidate()
+      self._camera.viewMatrix = self.viewMat
+      self.episodeParams = {}
+      self._objectScales = {}
+    if self._startStateCache is not None:
+      self._startStateCache.clear(removeStates=False)
+    if self._statePool is not None:
+      self._statePool.clear(removeStates=False)
+
+  #load the scene on the first call and snapshot it, later calls only restore the snapshot
+  def _restoreScene(self):
+    if self._p is None:
+      self._connect()
+    self._camera.invalidate()
+    if self._cell is not None:
+      self._restoreCell()
+    elif self._stateId is None:
+      self._loadScene()
+      self._stateId = self._p.saveState()
+    else:
+      self._p.restoreState(stateId=self._stateId)
+    #restoreState keeps the dynamics, the reset settles with the nominal ones
+    if self.episodeParams:
+      self._applyRandomParams({})
+      self.episodeParams = {}
+
+  #a new episode of the task with the arm settled at finalJPos, kwargs go to the sample of the task
+  def reset(self, finalJPos=None, seed=None, **kwargs):
+    task = self.task
+    if task is None:
+      raise NotImplementedError
+    #a seed restarts the env's random generator, every random draw of the episode comes from it
+    if seed is not None:
+      self._seed(seed)
+      #the scene snapshot holds the blocks at the scale drawn when it was taken, they are loaded again at the
+      #scale drawn from the seed
+      if self._fastReset and self._cell is None and self._randomizer is not None and 'objectScale' in self._randomizer.ranges:
+        self._stateId = None
+    self.terminated = 0
+    self.gripper_closed = task.gripperClosed
+    poses, gripperOrn = task.sample(self, **kwargs)
+    jointInitPos = list(finalJPos if finalJPos is not None else task.jointInitPos)
+    if task.fingerPos is not None:
+      jointInitPos += task.fingerPos
+    if self._fastReset:
+      self._restoreScene()
+      self._kuka.holdEndEffectorState(None)
+      held = [obj for obj in task.objects if obj.held]
+      for obj in held:
+        self._resetBody(getattr(self, obj.attr), *poses[obj.attr])
+      if gripperOrn is not None:
+        self._kuka.gripperInitOrn = list(gripperOrn)
+      #the arm settles with the held objects, their poses are part of the settled state
+      objectPose = tuple(part for obj in held for part in poses[obj.attr])
+      self._settleArm(jointInitPos, objectPose=objectPose or None)
+      for obj in task.objects:
+        if not obj.held:
+          self._resetBody(getattr(self, obj.attr), *poses[obj.attr])
+    else:
+      self._loadStaticScene()
+      self._loadObjects(poses, beforeKuka=True)
+      self._kuka = self._makeKuka(baseInitPos=[-0.1,0.0,0.07], jointInitPos=jointInitPos, \
+              gripperInitOrn=list(gripperOrn) if gripperOrn is not None else [0,0,0,1], **task.kukaParams)
+      self._loadObjects(poses, beforeKuka=False)
+
+    self._envStepCounter = 0
+    self._randomize()
+    self._stepAfterReset()
+    self._observation = self.getExtendedObservation()
+    return self._returnObservation()
+
+  def _loadStaticScene(self):
+    self._resetSimulation()
+    self._loadStaticBodies(tray=self.task.tray)
+    self._p.setGravity(0,0,-10)
+
+  #the objects loaded before or after the arm, at poses (attr -> (pos, orn)) or where the scene snapshot has them
+  def _loadObjects(self, poses=None, beforeKuka=False):
+    for obj in self.task.objects:
+      if obj.beforeKuka == beforeKuka:
+        pos, orn = poses[obj.attr] if poses is not None else (obj.pos, obj.orn)
+        uid = self._loadObject(obj.asset, pos, orn) if obj.scaled else self.assets.load(self._p, obj.asset, pos, orn)
+        setattr(self, obj.attr, uid)
+
+  #the arm stays in its default pose here, reset moves it to its joint positions and places the objects
+  def _loadScene(self):
+    if self.task is None:
+      raise NotImplementedError
+    self._loadStaticScene()
+    self._loadObjects(beforeKuka=True)
+    self._kuka = self._makeKuka(baseInitPos=[-0.1,0.0,0.07], **self.task.kukaParams)
+    self._loadObjects(beforeKuka=False)
+
+  #saveState would cover the other cells too: the bodies of a cell are loaded once, moved to its origin and kept out
+  #of the collisions of the other cells, later calls put them back at those poses
+  def _restoreCell(self):
+    if self._cellBodies is None:
+      _, index, origin = self._cell
+      firstBody = self._p.getNumBodies()
+      self._loadScene()
+      group = 1 << (index % 30)
+      self._cellBodies = []
+      for i in range(firstBody, self._p.getNumBodies()):
+        uid = self._p.getBodyUniqueId(i)
+        pos, orn = self._p.getBasePositionAndOrientation(uid)
+        pos = np.add(pos, origin).tolist()
+        self._p.resetBasePositionAndOrientation(uid, pos, orn)
+        numJoints = self._p.getNumJoints(uid)
+        for link in range(-1, numJoints):
+          if self._p.getDynamicsInfo(uid, link)[0] > 0:
+            self._p.setCollisionFilterGroupMask(uid, link, group | DYNAMIC_GROUP, group)
+          else:
+            self._p.setCollisionFilterGroupMask(uid, link, group, DYNAMIC_GROUP)
+        jointPos = [state[0] for state in self._p.getJointStates(uid, range(numJoints))] if numJoints > 0 else []
+        self._cellBodies.append((uid, pos, orn, jointPos))
+      return
+    for uid, pos, orn, jointPos in self._cellBodies:
+      self._resetBody(uid, pos, orn, relative=False)
+      for joint, q in enumerate(jointPos):
+        self._p.resetJointState(uid, joint, q)
+
+  #plane, table and, if tray, the tray the objects rest in, as the fidelity profile asks for
+  def _loadStaticBodies(self, tray=True):
+    #in a world of cells every plane would overlap all other cells, KukaContiMultiEnv loads one for all of them
+    if self._fidelityParams['plane'] and self._cell is None:
+      self.assets.load(self._p, "plane", [0,0,-1])
+    if self._fidelityParams['tableMesh']:
+      self.assets.load(self._p, "table", [0.5000000,0.00000,-.820000], [0.000000,0.000000,0.0,1.0])
+    else:
+      #the collision box of table.urdf without its five visual meshes
+      halfExtents = [0.75, 0.5, 0.025]
+      collision = self._p.createCollisionShape(self._p.GEOM_BOX, halfExtents=halfExtents)
+      visual = self._p.createVisualShape(self._p.GEOM_BOX, halfExtents=halfExtents, rgbaColor=[1,1,1,1])
+      tableUid = self._p.createMultiBody(0, collision, visual, [0.5,0.0,-0.22])
+      self._p.changeDynamics(tableUid, -1, lateralFriction=1.0)
+    if tray:
+      self.assets.load(self._p, "tray", [0.640000,0.075000,-0.190000], [0.000000,0.000000,1.000000,0.000000])
+
+  def _makeKuka(self, **kwargs):
+    if self._cell is not None:
+      kwargs['origin'] = self._cell[2]
+    return kuka.Kuka(urdfRootPath=self._urdfRoot, assets=self.assets, timeStep=self._timeStep, pybullet_client=self._p, \
+            profiler=self.profiler, loadTray=self._fidelityParams['kukaTray'], \
+            **dict(self._settleParams, **dict(self._ikParams, **kwargs)))
+
+  #the bodies whose mass and friction are randomized
+  def _objectUids(self):
+    if self.task is None:
+      return []
+    return [getattr(self, obj.attr) for obj in self.task.objects]
+
+  #loads a task object, at a sampled globalScaling if objectScale is randomized
+  def _loadObject(self, name, pos, orn):
+    if self._randomizer is None or 'objectScale' not in self._randomizer.ranges:
+      return self.assets.load(self._p, name, pos, orn)
+    scale = self._randomizer.draw('objectScale')
+    uid = self.assets.load(self._p, name, pos, orn, globalScaling=scale)
+    self._objectScales[uid] = scale
+    return uid
+
+  #samples the parameters of the episode and applies them once the reset settled
+  def _randomize(self):
+    if self._randomizer is None:
+      return
+    params = self._randomizer.sample()
+    self._applyRandomParams(params)
+    if 'objectScale' in self._randomizer.ranges:
+      params['objectScale'] = [self._objectScales.get(uid, 1.) for uid in self._objectUids()]
+    self.episodeParams = params
+    self._randomizer.log(params)
+
+  #the missing parameters are set back to their nominal values, objectScale only changes with a load
+  def _applyRandomParams(self, params):
+    massScale = params.get('objectMass', 1.)
+    frictionScale = params.get('objectFriction', 1.)
+    for uid in self._objectUids():
+      for link in range(-1, self._p.getNumJoints(uid)):
+        self._randomizer.applyDynamics(self._p, uid, link, massScale, frictionScale)
+    self._kuka.setMotorScales(params.get('fingerAForce', 1.), params.get('fingerBForce', 1.), \
+            params.get('fingerTipForce', 1.), params.get('positionGain', 1.))
+    if 'cameraPos' in params or 'cameraOrn' in params:
+      self._camera.viewMatrix = perturbView(self.viewMat, params.get('cameraPos', [0, 0, 0]), params.get('cameraOrn', [0, 0, 0]))
+    else:
+      self._camera.viewMatrix = self.viewMat
+    self._camera.invalidate()
+
+  #restores the settled state under key, returns what _saveStartState saved with it or None if there is none
+  def _restoreStartState(self, key):
+    if self._startStateCache is None:
+      return None
+    return self._startStateCache.restore(key)
+
+  def _saveStartState(self, key):
+    if self._startStateCache is not None:
+      kuka = self._kuka
+      self._startStateCache.save(key, {'endEffectorPos': [float(x) for x in kuka.endEffectorPos], \
+              'endEffectorAngle': float(kuka.endEffectorAngle)})
+
+  #Kuka after a restored settle gets the end effector target the settle left, the link frames restoreState
+  #recomputes would give another one than the frames stepSimulation left
+  def _syncRestoredArm(self, jointPos, extra):
+    self._kuka.syncState(jointPos)
+    self._kuka.endEffectorPos = np.array(extra['endEffectorPos'])
+    self._kuka.endEffectorAngle = extra['endEffectorAngle']
+
+  #A settled state only fits an env with the same bodies (urdfRoot, fidelity profile, object scales), the same
+  #physics settings and the same settle loop. They are part of the key, so envs of other configurations sharing
+  #startStateDir do not restore it.
+  def _startStateKey(self, name, jointPos, objectPose=None):
+    config = (('urdfRoot', self._urdfRoot), ('fidelity', self.fidelity), ('timeStep', float(self._timeStep)), \
+            ('numSubSteps', self._numSubSteps), ('numSolverIterations', self._numSolverIterations), \
+            ('settleParams', tuple(sorted(self._settleParams.items()))), \
+            ('objectScale', tuple(self._objectScales.get(uid, 1.) for uid in self._objectUids())))
+    return StartStateCache.makeKey(name, jointPos, objectPose, config)
+
+  #move the arm to jointInitPos, or restore the settled state from the start state cache.
+  #Cells put the joints there, moving the arm would step the other cells.
+  def _settleArm(self, jointInitPos, objectPose=None):
+    if self._cell is not None:
+      self._kuka.setJointInitPos(jointInitPos)
+      self._kuka.resetJoints(jointInitPos)
+      return
+    key = self._startStateKey(type(self).__name__, jointInitPos, objectPose)
+    extra = self._restoreStartState(key)
+    if extra is not None:
+      self._kuka.setJointInitPos(jointInitPos)
+      self._syncRestoredArm(jointInitPos, extra)
+    else:
+      self._kuka.resetState(jointInitPos=jointInitPos)
+      self._saveStartState(key)
+
+  #same for setGoodInitStateEE, which always starts from the pose of a default reset
+  def _settleArmEE(self, jointPoses):
+    if self._cell is not None:
+      self._kuka.resetJoints(jointPoses)
+      return
+    key = self._startStateKey(type(self).__name__+'EE', jointPoses)
+    extra = self._restoreStartState(key)
+    if extra is not None:
+      self._syncRestoredArm(jointPoses, extra)
+    else:
+      self._kuka.setGoodInitStateEE(jointPoses, self._renders)
+      self._saveStartState(key)
+
+  #pos is relative to the origin of a cell unless relative is False
+  def _resetBody(self, uid, pos, orn, relative=True):
+    if self._cell is not None and relative:
+      pos = np.add(pos, self._cell[2]).tolist()
+    self._p.resetBasePositionAndOrientation(uid, pos, orn)
+    self._p.resetBaseVelocity(uid, [0,0,0], [0,0,0])
+
+  #the physics step at the end of a reset, a cell leaves it out so that the other cells are not stepped
+  def _stepAfterReset(self):
+    if self._cell is None:
+      self._p.stepSimulation()
+
+  #start once cold and twice from the snapshot with the same random draws and compare the observations, for reset
+  #and for the start states of getGoodInitState, getMidInitState, getGoodMidInitState and setGoodInitState. With the
+  #start state cache the second fast start is a cache hit.
+  def checkFastReset(self, tol=1e-4, **kwargs):
+    fastReset = self._fastReset
+    randState = self.np_random.bit_generator.state
+    def observe(method):
+      self.np_random.bit_generator.state = randState
+      ob = method()
+      return np.array(ob[0] if isinstance(ob, tuple) else ob, dtype=np.float64)
+    starts = [lambda: self.reset(**kwargs)]
+    for name in ('getGoodInitState', 'getMidInitState', 'getGoodMidInitState'):
+      if hasattr(self, name):
+        starts.append(getattr(self, name))
+    try:
+      if hasattr(self, 'setGoodInitState') and hasattr(self, 'getGoodInitState'):
+        self._fastReset = False
+        self.np_random.bit_generator.state = randState
+        goodOb, goodJointPos = self.getGoodInitState()
+        extra = self.getExtraInfo()
+        starts.append(lambda: (self.setGoodInitState(goodOb, list(goodJointPos), extra), self._observation)[1])
+      for method in starts:
+        self._fastReset = False
+        coldOb = observe(method)
+        self._fastReset = True
+        #the first fast start after a cold one rebuilds the snapshot
+        for _ in range(3):
+          if np.max(np.abs(coldOb-observe(method))) > tol:
+            return False
+    finally:
+      self._fastReset = fastReset
+      self.np_random.bit_generator.state = randState
+    return True
 
   def _seed(self, seed=None):
     self.np_random, seed = seeding.np_random(seed)
+    if self._randomizer is not None:
+      self._randomizer.seed(seed)
     return [seed]
 
+  def seed(self, seed=None):
+    return self._seed(seed)
+
+  #snapshot of the simulation and the episode, returns a handle for restoreState. The handle stays valid
+  #until it is evicted from the pool or a cold reset (fastReset off) rebuilds the world.
+  def cloneState(self):
+    if self._cell is not None:
+      raise RuntimeError('saveState covers the whole world, a cell of KukaContiMultiEnv can not be cloned')
+    kuka = self._kuka
+    episodeState = {
+        'envStepCounter': self._envStepCounter,
+        'terminated': self.terminated,
+        'gripper_closed': self.gripper_closed,
+        'endEffectorPos': np.array(kuka.endEffectorPos),
+        'endEffectorAngle': kuka.endEffectorAngle,
+        'lastIK': kuka._lastIK,
+        'jointPositions': list(kuka.jointPositions),
+        'motorTargets': dict(kuka.motorTargets),
+        'randomState': self.np_random.bit_generator.state,
+        'episodeParams': dict(self.episodeParams),
+        #restoreState recomputes the link frames, the restored env goes on from what this one has read
+        'endEffectorState': kuka.endEffectorState,
+        'observation': np.copy(self._observation),
+    }
+    return self._statePool.save(episodeState)
+
+  #puts the env back into a state from cloneState and returns its observation
+  def restoreState(self, handle):
+    episodeState = self._statePool.restore(handle)
+    kuka = self._kuka
+    #saveState does not store motor commands
+    kuka.restoreMotors(episodeState['motorTargets'])
+    kuka.endEffectorPos = np.array(episodeState['endEffectorPos'])
+    kuka.endEffectorAngle = episodeState['endEffectorAngle']
+    kuka._lastIK = episodeState['lastIK']
+    kuka.jointPositions = list(episodeState['jointPositions'])
+    self._envStepCounter = episodeState['envStepCounter']
+    self.terminated = episodeState['terminated']
+    self.gripper_closed = episodeState['gripper_closed']
+    self.np_random.bit_generator.state = episodeState['randomState']
+    #restoreState keeps the dynamics of the current episode
+    if self._randomizer is not None:
+      self._applyRandomParams(episodeState['episodeParams'])
+      self.episodeParams = dict(episodeState['episodeParams'])
+    kuka.endEffectorState = episodeState['endEffectorState']
+    kuka.holdEndEffectorState(episodeState['endEffectorState'])
+    self._observation = np.copy(episodeState['observation'])
+    return self._returnObservation()
+
+  def releaseState(self, handle):
+    self._statePool.release(handle)
+
+  #total reward of every action sequence, each one played from the current state with stepMethod until
+  #it runs out or the episode is done. The env is back in the current state afterwards.
+  def evaluateActionSequences(self, actionSequences, stepMethod='step'):
+    step = getattr(self, stepMethod)
+    returns = np.zeros(len(actionSequences))
+    handle = self.cloneState()
+    try:
+      for i, actions in enumerate(actionSequences):
+        self.restoreState(handle)
+        for action in actions:
+          _, reward, done, _ = step(action)
+          returns[i] += reward
+          if done:
+            break
+      self.restoreState(handle)
+    finally:
+      self.releaseState(handle)
+    return returns
+
+  #the outcome of the terminal phase. failure only returns True once it can no longer change, a success
+  #may still be undone later in the phase, e.g. by a block slipping out of the gripper
+  def success(self):
+    return self.task is not None and bool(self.task.success(self))
+
+  def failure(self):
+    return self.task is not None and self.task.failure is not None and bool(self.task.failure(self))
+
+  #number of physics steps that take as long as numTicks steps at 240 Hz
+  def _ticks(self, numTicks):
+    return max(1, int(round(numTicks/self._tickScale)))
+
+  #runs the terminal phase and returns its ticks, a cell leaves it to KukaContiMultiEnv, which runs the phases of all
+  #cells together
+  def _runPhase(self, phase):
+    if self._cell is not None:
+      self._pendingPhase = phase.ticks(**self._terminalStop())
+      return None
+    return phase.run(**self._terminalStop())
+
+  #keyword arguments for ScriptedPhase.run of the terminal phase, checkEvery and window are in 240 Hz steps
+  def _terminalStop(self):
+    if self._terminalParams is None:
+      return {}
+    checkEvery = self._ticks(self._terminalParams.get('checkEvery', 10))
+    window = self._ticks(self._terminalParams.get('window', 50))
+    success = self.success if self._terminalParams.get('stopOnSuccess', False) else None
+    return {'stopWhen': StableOutcome(success, self.failure, max(1, window//checkEvery)), 'checkEvery': checkEvery}
+
+  #uid and link index for an (attr, link) of the task, see TaskSpec.distance
+  def _taskLink(self, attr, link):
+    if attr == 'kuka':
+      return self._kuka.kukaUid, self._kuka.kukaEndEffectorIndex if link == 'ee' else link
+    return getattr(self, attr), link
+
+  #position and orientation of the object the observation is relative to
+  def getObjectPose(self):
+    uid, link = self._taskLink(*self.task.target)
+    if link is None:
+      return self._p.getBasePositionAndOrientation(uid)
+    linkState = self._p.getLinkState(uid, link)
+    return linkState[0], linkState[1]
+
+  #ends the episode after maxSteps steps or runs the terminal macro once it is triggered
+  def _termination(self):
+    #step has just read the end effector link state for the observation
+    state = self._kuka.endEffectorState
+    if (self.terminated or self._envStepCounter > self.task.maxSteps):
+      self._observation = self.getExtendedObservation()
+      return True
+    macro = self.task.terminal
+    if macro.trigger(self, state):
+      self.terminated = 1
+      self.gripper_closed = macro.gripperClosed
+      phase = ScriptedPhase(self._p, self._kuka.kukaUid, self._ticks(macro.numTicks), macro.tracks(self, state), \
+              self.profiler, self._kuka.motorTargets)
+      self._runPhase(phase)
+      self._observation = self.getExtendedObservation()
+      return True
+    return False
+
+  #1 once the episode terminated in the goal of the task, the goal is only looked at then
+  def _reward(self):
+    if self.terminated and self.task.goal(self):
+      return 1.0
+    return 0.0
+
+  #rewards is the distance between the two parts of the task's distance
+  def internalReward(self):
+    (uidA, linkA), (uidB, linkB) = [self._taskLink(attr, link) for attr, link in self.task.distance]
+    kwargs = {}
+    if linkA is not None:
+      kwargs['linkIndexA'] = linkA
+    if linkB is not None:
+      kwargs['linkIndexB'] = linkB
+    closestPoints = self._p.getClosestPoints(uidA, uidB, 1000, **kwargs)
+    reward = -1000
+    numPt = len(closestPoints)
+    if (numPt>0):
+      reward = -closestPoints[0][8]*10
+    return reward
+
   def getExtendedObservation(self):
-     self._observation = self._kuka.getObservation()
-     eeState  = p.getLinkState(self._kuka.kukaUid,self._kuka.kukaEndEffectorIndex)
-     endEffectorPos = eeState[0]
-     endEffectorOrn = eeState[1]
-     blockPos,blockOrn = p.getBasePositionAndOrientation(self.blockUid)
+    if self._obsBuffer is None:
+      self._obsBuffer = np.zeros(self._kuka.getObservationDimension()+6, dtype=np.float32)
+    self._kuka.getObservation(out=self._obsBuffer[:-6])
+    self._observation = self._obsBuffer
+    endEffectorPos, endEffectorOrn = self._kuka.endEffectorState[0], self._kuka.endEffectorState[1]
+    blockPos,blockOrn = self.getObjectPose()
 
-     invEEPos,invEEOrn = p.invertTransform(endEffectorPos,endEffectorOrn)
-     blockPosInEE,blockOrnInEE = p.multiplyTransforms(invEEPos,invEEOrn,blockPos,blockOrn)
-     blockEulerInEE = p.getEulerFromQuaternion(blockOrnInEE)
-     self._observation.extend(list(blockPosInEE))
-     self._observation.extend(list(blockEulerInEE))
+    invEEPos,invEEOrn = self._p.invertTransform(endEffectorPos,endEffectorOrn)
+    blockPosInEE,blockOrnInEE = self._p.multiplyTransforms(invEEPos,invEEOrn,blockPos,blockOrn)
+    self._observation[-6:-3] = blockPosInEE
+    self._observation[-3:] = self._p.getEulerFromQuaternion(blockOrnInEE)
 
-     return self._observation
+    return self._observation
+
+  def _returnObservation(self):
+    return self._observation.copy() if self._copyObs else self._observation
 
   def getImgObservation(self):
-    img_arr = p.getCameraImage(width=self._width,height=self._height,viewMatrix=self.viewMat,projectionMatrix=self.projMatrix)
-    rgb=img_arr[2]
-    np_img_arr = np.reshape(rgb, (self._height, self._width, 4))
-    self._observation = np_img_arr
-    return self._observation
+    with self.profiler.section('render'):
+      self._observation = self._camera.getImage(self._envStepCounter)
+    return self._returnObservation()
 
-  def getCurrentJointPos(self):
-    jointStates = list(p.getJointStates(self._kuka.kukaUid, range(self._kuka.kukaEndEffectorIndex+1)))
-    jointPoses = []
-    for state in jointStates:
-        jointPoses.append(list(state)[0])
+  def _captureFrames(self):
+    if self.cameraRig is not None:
+      with self.profiler.section('render'):
+        self.cameraRig.capture(self._envStepCounter)
 
-    return jointPoses
+  def getCurrentJointPos(self):
+    return self._kuka.getJointPos(self._kuka.kukaEndEffectorIndex+1).tolist()
 
   def getExtraInfo(self):
     return None
@@ -102,28 +701,75 @@ class KukaContiEnv(gym.Env):
     return self.stepPosDiff(action)
 
   def step2(self, action):
+    self.profiler.beginStep()
     action = np.clip(action, self.action_space.low, self.action_space.high)
-    self._kuka.applyAction2(action, self._renders)
+    with self.profiler.section('settle'):
+      physicsSteps = 0
+      for _ in range(self._actionRepeat):
+        physicsSteps += self._kuka.applyAction2(action, self._renders)
 
-    self._observation = self.getExtendedObservation()
+    with self.profiler.section('observation'):
+      self._observation = self.getExtendedObservation()
     self._envStepCounter += 1
+    self._captureFrames()
 
-    done = self._termination()
+    with self.profiler.section('termination'):
+      done = self._termination()
     reward = self._reward()
+    self.profiler.endStep()
 
-    return np.array(self._observation), reward, done, {}
+    return self._returnObservation(), reward, done, {'physicsSteps': physicsSteps}
+
+  #The parts of a step of a cell, KukaContiMultiEnv runs the settle loops and terminal phases of all cells in
+  #lockstep between them. stepMethod is the step the action is meant for.
+  def _cellSettle(self, action, stepMethod):
+    action = np.clip(action, self.action_space.low, self.action_space.high)
+    if stepMethod == 'step2':
+      return self._kuka.action2Settle(action)
+    return self._kuka.posDiffSettle(action)
+
+  #returns done and the terminal phase to run, if one started
+  def _cellObserve(self):
+    self._observation = self.getExtendedObservation()
+    self._envStepCounter += 1
+    self._captureFrames()
+    done = self._termination()
+    phase, self._pendingPhase = self._pendingPhase, None
+    return done, phase
+
+  def _cellFinish(self, ranPhase):
+    if ranPhase:
+      self._observation = self.getExtendedObservation()
+    return self._observation, self._reward()
 
   #directly apply position difference commends
   def stepPosDiff(self, action):
+    self.profiler.beginStep()
     action = np.clip(action, self.action_space.low, self.action_space.high)
-    self._kuka.applyPosDiffAction(action, self._renders)
-    self._observation = self.getExtendedObservation()
+    with self.profiler.section('settle'):
+      physicsSteps = 0
+      for _ in range(self._actionRepeat):
+        physicsSteps += self._kuka.applyPosDiffAction(action, self._renders)
+    with self.profiler.section('observation'):
+      self._observation = self.getExtendedObservation()
     self._envStepCounter += 1
+    self._captureFrames()
     
-    done = self._termination()
+    with self.profiler.section('termination'):
+      done = self._termination()
     reward = self._reward()
+    self.profiler.endStep()
     
-    return np.array(self._observation), reward, done, {}
+    return self._returnObservation(), reward, done, {'physicsSteps': physicsSteps}
 
   def _render(self, mode='human', close=False):
       return
+
+  #color image of the observation camera, the observation is left as it is. In human mode the GUI shows the scene
+  def render(self, mode='rgb_array'):
+    if mode != 'rgb_array':
+      return None
+    with self.profiler.section('render'):
+      self._camera.render()
+    _, start, stop = self._camera.planes[0]
+    return self._camera.image[:, :, start:min(stop, start+3)].copy()
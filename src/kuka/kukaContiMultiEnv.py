@@ -0,0 +1,87 @@
+import numpy as np
+import pybullet as p
+from pybullet_utils import bullet_client
+from .kukaContiEnv import CELL_GROUPS, DYNAMIC_GROUP
+
+class KukaContiMultiEnv(object):
+  #Runs n workcells of the same task in one DIRECT physics world. Every cell is an env of env_cls with its own Kuka,
+  #table and objects, spacing apart along y and out of the collisions of the other cells. The settle loops and terminal
+  #phases of all cells advance in lockstep, so one stepSimulation steps every arm. stepMethod picks what the actions
+  #are: joint differences for 'step' and 'stepPosDiff', end effector moves for 'step2'.
+  def __init__(self, env_cls, n, spacing=3.0, stepMethod='step', **kwargs):
+    #observations are copied into the stacked array anyway, so the envs can hand out their buffers
+    kwargs.setdefault('copyObs', False)
+    self._p = bullet_client.BulletClient(connection_mode=p.DIRECT)
+    self.envs = [env_cls(cell=(self._p, i, [0.0, i*spacing, 0.0]), **kwargs) for i in range(n)]
+    #one ground plane for all cells
+    if self.envs[0]._fidelityParams['plane']:
+      planeUid = self.envs[0].assets.load(self._p, "plane", [0,0,-1])
+      self._p.setCollisionFilterGroupMask(planeUid, -1, CELL_GROUPS, DYNAMIC_GROUP)
+    self.num_envs = n
+    self.stepMethod = stepMethod
+    self.action_space = self.envs[0].action_space
+    self.observation_space = self.envs[0].observation_space
+    obsDim = self.observation_space.shape[0]
+    self._obs = np.zeros((n, obsDim), dtype=np.float64)
+    self._rewards = np.zeros(n, dtype=np.float64)
+    self._dones = np.zeros(n, dtype=bool)
+
+  #with a seed env i is seeded with seed+i, kwargs go to the reset of every env (e.g. finalJPos)
+  def reset(self, seed=None, **kwargs):
+    for i, env in enumerate(self.envs):
+      self._obs[i] = env.reset(seed=None if seed is None else seed+i, **kwargs)
+    return self._obs.copy()
+
+  #Advances the settle loops or phases of the cells (None for cells without one) together: every round steps the world
+  #by the smallest number of steps a loop asks for. Returns the number of physics steps of every loop.
+  def _lockstep(self, loops):
+    results = [0]*len(loops)
+    requests = {}
+    for i, loop in enumerate(loops):
+      if loop is None:
+        continue
+      try:
+        requests[i] = next(loop)
+      except StopIteration as stop:
+        results[i] = stop.value
+    while requests:
+      numSteps = min(requests.values())
+      for _ in range(numSteps):
+        self._p.stepSimulation()
+      for i in list(requests):
+        try:
+          requests[i] = loops[i].send(numSteps)
+        except StopIteration as stop:
+          results[i] = stop.value
+          del requests[i]
+    return results
+
+  #envs that are done are reset right away, their last observation is kept in the info dict
+  def step(self, actions):
+    actions = np.asarray(actions)
+    physicsSteps = np.zeros(self.num_envs, dtype=np.int64)
+    for _ in range(self.envs[0]._actionRepeat):
+      physicsSteps += self._lockstep([env._cellSettle(actions[i], self.stepMethod) for i, env in enumerate(self.envs)])
+    phases = []
+    for i, env in enumerate(self.envs):
+      self._dones[i], phase = env._cellObserve()
+      phases.append(phase)
+    physicsSteps += self._lockstep(phases)
+    infos = []
+    for i, env in enumerate(self.envs):
+      ob, self._rewards[i] = env._cellFinish(phases[i] is not None)
+      info = {'physicsSteps': int(physicsSteps[i])}
+      if self._dones[i]:
+        info['terminal_observation'] = np.array(ob)
+        ob = env.reset()
+      self._obs[i] = ob
+      infos.append(info)
+    return self._obs.copy(), self._rewards.copy(), self._dones.copy(), infos
+
+  def close(self):
+    for env in self.envs:
+      env.close()
+    self.envs = []
+    if self._p is not None:
+      self._p.disconnect()
+      self._p = None
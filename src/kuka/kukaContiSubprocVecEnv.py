@@ -0,0 +1,147 @@
+import multiprocessing as mp
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+
+def _attach(name, shape, dtype):
+  shm = shared_memory.SharedMemory(name=name)
+  return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+def _worker(remote, parentRemote, env_cls, kwargs, index):
+  parentRemote.close()
+  env = env_cls(**kwargs)
+  remote.send((env.observation_space, env.action_space))
+  #the parent allocates the shared buffers once it knows the observation and action dimensions
+  layout = remote.recv()
+  handles = []
+  buffers = {}
+  for key, (name, shape, dtype) in layout.items():
+    shm, arr = _attach(name, shape, dtype)
+    handles.append(shm)
+    buffers[key] = arr
+  obs, terminalObs = buffers['obs'], buffers['terminalObs']
+  actions, rewards, dones = buffers['actions'], buffers['rewards'], buffers['dones']
+  physicsSteps = buffers['physicsSteps']
+  try:
+    while True:
+      cmd = remote.recv()
+      if cmd == 'step':
+        ob, reward, done, info = env.step(actions[index])
+        if done:
+          terminalObs[index] = ob
+          ob = env.reset()
+        obs[index] = ob
+        rewards[index] = reward
+        dones[index] = done
+        physicsSteps[index] = info.pop('physicsSteps', 0)
+        #physicsSteps is in shared memory too, only the keys left over go through the pipe
+        remote.send(info if info else None)
+      elif cmd == 'close':
+        break
+      else:
+        #('reset', seed)
+        obs[index] = env.reset(seed=cmd[1])
+        remote.send(None)
+  finally:
+    del obs, terminalObs, actions, rewards, dones, physicsSteps, buffers
+    for shm in handles:
+      shm.close()
+    env.close()
+    remote.close()
+
+class KukaContiSubprocVecEnv(object):
+  #Runs every env in its own process, observations, rewards, dones and physics steps are written by the workers
+  #straight into shared memory, so only a short command string goes through the pipes per step
+  def __init__(self, env_cls, n, startMethod=None, **kwargs):
+    ctx = mp.get_context(startMethod)
+    #the workers copy observations into shared memory, so the envs can hand out their buffers
+    kwargs.setdefault('copyObs', False)
+    #workers have to share the parent's resource tracker, otherwise the blocks get unlinked when a worker exits
+    resource_tracker.ensure_running()
+    self.num_envs = n
+    self.waiting = False
+    self.closed = False
+    self.remotes, workRemotes = zip(*[ctx.Pipe() for _ in range(n)])
+    self.processes = []
+    for i in range(n):
+      proc = ctx.Process(target=_worker, args=(workRemotes[i], self.remotes[i], env_cls, kwargs, i), daemon=True)
+      proc.start()
+      workRemotes[i].close()
+      self.processes.append(proc)
+
+    spaces = [remote.recv() for remote in self.remotes]
+    self.observation_space, self.action_space = spaces[0]
+    obsDim = self.observation_space.shape[0]
+    actDim = self.action_space.shape[0]
+
+    shapes = {
+        'obs': ((n, obsDim), np.float64),
+        'terminalObs': ((n, obsDim), np.float64),
+        'actions': ((n, actDim), np.float64),
+        'rewards': ((n,), np.float64),
+        'dones': ((n,), np.bool_),
+        'physicsSteps': ((n,), np.int64),
+    }
+    self._shms = {}
+    self._buffers = {}
+    layout = {}
+    for key, (shape, dtype) in shapes.items():
+      nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+      shm = shared_memory.SharedMemory(create=True, size=nbytes)
+      self._shms[key] = shm
+      self._buffers[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+      self._buffers[key][:] = 0
+      layout[key] = (shm.name, shape, dtype)
+    for remote in self.remotes:
+      remote.send(layout)
+
+  #with a seed env i is seeded with seed+i
+  def reset(self, seed=None):
+    for i, remote in enumerate(self.remotes):
+      remote.send(('reset', None if seed is None else seed+i))
+    for remote in self.remotes:
+      remote.recv()
+    return self._buffers['obs'].copy()
+
+  def step_async(self, actions):
+    self._buffers['actions'][:] = actions
+    for remote in self.remotes:
+      remote.send('step')
+    self.waiting = True
+
+  #envs that are done have already been reset by their worker,
+  #their last observation is kept in the info dict
+  def step_wait(self):
+    infos = [remote.recv() for remote in self.remotes]
+    self.waiting = False
+    obs = self._buffers['obs'].copy()
+    dones = self._buffers['dones'].copy()
+    physicsSteps = self._buffers['physicsSteps']
+    for i in range(self.num_envs):
+      infos[i] = dict(infos[i] or {}, physicsSteps=int(physicsSteps[i]))
+      if dones[i]:
+        infos[i] = dict(infos[i], terminal_observation=self._buffers['terminalObs'][i].copy())
+    return obs, self._buffers['rewards'].copy(), dones, infos
+
+  def step(self, actions):
+    self.step_async(actions)
+    return self.step_wait()
+
+  def close(self):
+    if self.closed:
+      return
+    if self.waiting:
+      for remote in self.remotes:
+        remote.recv()
+    for remote in self.remotes:
+      remote.send('close')
+    for proc in self.processes:
+      proc.join()
+    self._buffers = {}
+    for shm in self._shms.values():
+      shm.close()
+      shm.unlink()
+    self.closed = True
+
+  def __del__(self):
+    if not getattr(self, 'closed', True):
+      self.close()
@@ -0,0 +1,41 @@
+import numpy as np
+
+class KukaContiVecEnv(object):
+  #Runs n envs of the same task in one process, each env drives its own DIRECT physics client
+  def __init__(self, env_cls, n, **kwargs):
+    #observations are copied into the stacked array anyway, so the envs can hand out their buffers
+    kwargs.setdefault('copyObs', False)
+    self.envs = [env_cls(**kwargs) for _ in range(n)]
+    self.num_envs = n
+    self.action_space = self.envs[0].action_space
+    self.observation_space = self.envs[0].observation_space
+    obsDim = self.observation_space.shape[0]
+    self._obs = np.zeros((n, obsDim), dtype=np.float64)
+    self._rewards = np.zeros(n, dtype=np.float64)
+    self._dones = np.zeros(n, dtype=bool)
+
+  #with a seed env i is seeded with seed+i
+  def reset(self, seed=None):
+    for i, env in enumerate(self.envs):
+      self._obs[i] = env.reset(seed=None if seed is None else seed+i)
+    return self._obs.copy()
+
+  #envs that are done are reset right away, their last observation is kept in the info dict
+  def step(self, actions):
+    actions = np.asarray(actions)
+    infos = []
+    for i, env in enumerate(self.envs):
+      ob, reward, done, info = env.step(actions[i])
+      if done:
+        info = dict(info, terminal_observation=ob.copy())
+        ob = env.reset()
+      self._obs[i] = ob
+      self._rewards[i] = reward
+      self._dones[i] = done
+      infos.append(info)
+    return self._obs.copy(), self._rewards.copy(), self._dones.copy(), infos
+
+  def close(self):
+    for env in self.envs:
+      env.close()
+    self.envs = []
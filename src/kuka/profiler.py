@@ -0,0 +1,118 @@
+import time
+from collections import defaultdict
+import numpy as np
+
+class _NullSection(object):
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    return False
+
+class NullProfiler(object):
+  #Stands in for StepProfiler when profiling is off, every hook is a no-op
+  enabled = False
+  _section = _NullSection()
+
+  def section(self, name):
+    return self._section
+
+  def count(self, name, n=1):
+    pass
+
+  def beginStep(self):
+    pass
+
+  def endStep(self):
+    pass
+
+NULL_PROFILER = NullProfiler()
+
+class _Section(object):
+  def __init__(self, profiler, name):
+    self.profiler = profiler
+    self.name = name
+
+  def __enter__(self):
+    self.start = time.perf_counter()
+    return self
+
+  def __exit__(self, *args):
+    self.profiler._record[self.name] += time.perf_counter()-self.start
+    return False
+
+class StepProfiler(object):
+  #Records per step the wall time of named sections and the value of named counters, anything hit
+  #outside of beginStep/endStep (e.g. in reset) is dropped. Sections may be nested, e.g. 'ik' inside
+  #'termination', every section keeps its own total.
+  enabled = True
+
+  def __init__(self):
+    self.steps = []
+    self._record = defaultdict(float)
+
+  def section(self, name):
+    return _Section(self, name)
+
+  def count(self, name, n=1):
+    self._record[name] += n
+
+  def beginStep(self):
+    self._record = defaultdict(float)
+    self._stepStart = time.perf_counter()
+
+  #the whole step is recorded as 'step'
+  def endStep(self):
+    self._record['step'] = time.perf_counter()-self._stepStart
+    self.steps.append(dict(self._record))
+
+  def reset(self):
+    self.steps = []
+    self._record = defaultdict(float)
+
+  def names(self):
+    names = set()
+    for record in self.steps:
+      names.update(record)
+    return sorted(names)
+
+  #values of name for every recorded step, 0 for steps that did not enter the section
+  def values(self, name):
+    return np.array([record.get(name, 0.0) for record in self.steps])
+
+  def histogram(self, name, bins=20):
+    counts, edges = np.histogram(self.values(name), bins=bins)
+    return counts, edges
+
+  def summary(self, bins=20):
+    summary = {}
+    for name in self.names():
+      values = self.values(name)
+      counts, edges = np.histogram(values, bins=bins)
+      summary[name] = {
+          'steps': len(values),
+          'total': float(values.sum()),
+          'mean': float(values.mean()),
+          'p50': float(np.percentile(values, 50)),
+          'p90': float(np.percentile(values, 90)),
+          'p99': float(np.percentile(values, 99)),
+          'max': float(values.max()),
+          'histogram': {'counts': counts.tolist(), 'edges': edges.tolist()},
+      }
+    return summary
+
+  #json and csv are only imported by the exports, importing the envs does not need them
+  def toJSON(self, fileName, bins=20):
+    import json
+    with open(fileName, 'w') as f:
+      json.dump(self.summary(bins), f, indent=2)
+
+  #one row per section or counter, without the histograms
+  def toCSV(self, fileName):
+    import csv
+    fields = ['name', 'steps', 'total', 'mean', 'p50', 'p90', 'p99', 'max']
+    with open(fileName, 'w', newline='') as f:
+      writer = csv.writer(f)
+      writer.writerow(fields)
+      for name, stats in self.summary().items():
+        writer.writerow([name]+[stats[field] for field in fields[1:]])
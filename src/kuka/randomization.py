@@ -0,0 +1,99 @@
+import json
+from collections import deque
+import numpy as np
+import pybullet as p
+
+#the parameters DomainRandomizer samples and their dimension. objectMass and objectFriction (lateral friction) of
+#every link of the task objects, the finger forces and positionGain (the position gains of the motor commands) of
+#Kuka are factors on their nominal values. objectScale is the globalScaling the blocks are loaded with, cameraPos
+#(m) and cameraOrn (roll, pitch, yaw in rad) move and turn the observation camera in its own frame.
+RANDOM_PARAMS = {
+    'objectMass': 1,
+    'objectFriction': 1,
+    'fingerAForce': 1,
+    'fingerBForce': 1,
+    'fingerTipForce': 1,
+    'positionGain': 1,
+    'objectScale': 1,
+    'cameraPos': 3,
+    'cameraOrn': 3,
+}
+
+class DomainRandomizer(object):
+  #Samples the parameters in ranges, name -> (low, high) drawn uniformly, with one vectorized draw per parameter
+  #for batchSize episodes at a time. Dynamics are sent to pybullet only where they changed since the last call.
+  #Every logged episode is kept in history (the last historySize) and, with a logFile, appended to it as one JSON line.
+  def __init__(self, ranges, batchSize=64, historySize=1000, logFile=None, seed=None):
+    self.ranges = {}
+    for name, (low, high) in ranges.items():
+      if name not in RANDOM_PARAMS:
+        raise ValueError('unknown randomization parameter %s, one of %s' % (name, ', '.join(RANDOM_PARAMS)))
+      shape = (RANDOM_PARAMS[name],)
+      self.ranges[name] = (np.broadcast_to(np.asarray(low, dtype=np.float64), shape), \
+              np.broadcast_to(np.asarray(high, dtype=np.float64), shape))
+    self.batchSize = batchSize
+    self.history = deque(maxlen=historySize)
+    self.logFile = logFile
+    self.episode = 0
+    #(uid, link) -> [nominal mass, nominal lateral friction, mass factor, friction factor]
+    self._dynamics = {}
+    self.seed(seed)
+
+  #drops the batches drawn so far
+  def seed(self, seed=None):
+    self._rng = np.random.default_rng(seed)
+    self._batches = {}
+
+  #the next value of a parameter, a float or a list for cameraPos and cameraOrn
+  def draw(self, name):
+    batch, index = self._batches.get(name, (None, self.batchSize))
+    if index >= self.batchSize:
+      low, high = self.ranges[name]
+      batch = self._rng.uniform(low, high, size=(self.batchSize, len(low)))
+      index = 0
+    self._batches[name] = (batch, index+1)
+    value = batch[index]
+    return float(value[0]) if len(value) == 1 else value.tolist()
+
+  #the parameters of the next episode, objectScale is drawn when an object is loaded
+  def sample(self):
+    return dict((name, self.draw(name)) for name in self.ranges if name != 'objectScale')
+
+  def log(self, params):
+    record = dict(params, episode=self.episode)
+    self.episode += 1
+    self.history.append(record)
+    if self.logFile is not None:
+      with open(self.logFile, 'a') as f:
+        f.write(json.dumps(record)+'\n')
+
+  #sets mass and lateral friction of a link to factors of its nominal values read on the first call,
+  #returns the number of values that changed
+  def applyDynamics(self, pybullet_client, uid, link, massScale=1., frictionScale=1.):
+    dynamics = self._dynamics.get((uid, link))
+    if dynamics is None:
+      info = pybullet_client.getDynamicsInfo(uid, link)
+      dynamics = self._dynamics[(uid, link)] = [info[0], info[1], 1., 1.]
+    kwargs = {}
+    #links without mass are static
+    if massScale != dynamics[2] and dynamics[0] > 0:
+      kwargs['mass'] = dynamics[0]*massScale
+      dynamics[2] = massScale
+    if frictionScale != dynamics[3]:
+      kwargs['lateralFriction'] = dynamics[1]*frictionScale
+      dynamics[3] = frictionScale
+    if kwargs:
+      pybullet_client.changeDynamics(uid, link, **kwargs)
+    return len(kwargs)
+
+  #the bodies were loaded again, with their nominal dynamics
+  def invalidate(self):
+    self._dynamics = {}
+
+#view matrix (column major, as pybullet takes it) of a camera moved by pos and turned by orn in its own frame
+def perturbView(viewMatrix, pos, orn):
+  rotation = np.array(p.getMatrixFromQuaternion(p.getQuaternionFromEuler(orn))).reshape(3, 3)
+  offset = np.eye(4)
+  offset[:3, :3] = rotation.T
+  offset[:3, 3] = -rotation.T.dot(pos)
+  return offset.dot(np.array(viewMatrix).reshape(4, 4).T).T.flatten().tolist()
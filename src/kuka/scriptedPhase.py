@@ -0,0 +1,148 @@
+import pybullet as p
+from .profiler import NULL_PROFILER
+
+class Ramp(object):
+  #start, start+delta, start+2*delta, ... stopped at limit. The value is accumulated tick by tick
+  #like the hand written loops did, so a scripted phase replays them exactly.
+  def __init__(self, start, delta, limit):
+    self.start = start
+    self.delta = delta
+    self.limit = limit
+    self.value = start
+
+  def reset(self):
+    self.value = self.start
+
+  #the value for this tick, then advance to the next one
+  def __call__(self):
+    value = self.value
+    self.value = self.value+self.delta
+    if (self.delta < 0 and self.value < self.limit) or (self.delta > 0 and self.value > self.limit):
+      self.value = self.limit
+    return value
+
+class JointTrack(object):
+  #Position targets for a group of joints. targets is a constant sequence or a callable that is
+  #called once per tick and returns one target per joint.
+  def __init__(self, jointIndices, targets, forces, positionGains=None, velocityGains=None):
+    self.jointIndices = list(jointIndices)
+    self.targets = targets
+    self.forces = list(forces)
+    self.positionGains = positionGains
+    self.velocityGains = velocityGains
+    self._lastTargets = None
+
+  def reset(self):
+    self._lastTargets = None
+
+  #the targets are sent to the motors only if they differ from the ones sent last tick,
+  #the motors keep their targets in between. motorTargets, e.g. Kuka.motorTargets, records them.
+  def apply(self, pybullet_client, bodyUid, motorTargets=None):
+    targets = self.targets() if callable(self.targets) else self.targets
+    targets = [float(target) for target in targets]
+    if targets == self._lastTargets:
+      return False
+    kwargs = {}
+    if self.positionGains is not None:
+      kwargs['positionGains'] = self.positionGains
+    if self.velocityGains is not None:
+      kwargs['velocityGains'] = self.velocityGains
+    pybullet_client.setJointMotorControlArray(bodyUid, self.jointIndices, p.POSITION_CONTROL, \
+            targetPositions=targets, targetVelocities=[0]*len(targets), forces=self.forces, **kwargs)
+    self._lastTargets = targets
+    if motorTargets is not None:
+      positionGains = self.positionGains or [0.1]*len(targets)
+      velocityGains = self.velocityGains or [1.0]*len(targets)
+      for motor in zip(self.jointIndices, targets, self.forces, positionGains, velocityGains):
+        motorTargets[motor[0]] = motor[1:]
+    return True
+
+class CartesianTrack(JointTrack):
+  #Arm joint targets solved by IK for an end effector pose. pose is called once per tick and returns
+  #(pos, orn), orn None keeps the gripper pointing down. The gains are the ones of the arm commands of kuka,
+  #scaled like them by setMotorScales.
+  def __init__(self, kuka, pose):
+    numArmJoints = kuka.kukaEndEffectorIndex+1
+    JointTrack.__init__(self, range(numArmJoints), self._solve, [kuka.maxForce]*numArmJoints, \
+            positionGains=list(kuka._armGains[:numArmJoints]), velocityGains=list(kuka._velocityGains[:numArmJoints]))
+    self.kuka = kuka
+    self.pose = pose
+
+  def _solve(self):
+    pos, orn = self.pose()
+    return self.kuka.calculateIK(pos, orn)[:len(self.jointIndices)]
+
+class ScriptedPhase(object):
+  #Drives the motors of bodyUid along the tracks for numTicks physics steps, the motor commands are recorded in
+  #motorTargets if given. stopWhen, if given, is checked every checkEvery ticks and ends the phase early once it returns True.
+  def __init__(self, pybullet_client, bodyUid, numTicks, tracks, profiler=NULL_PROFILER, motorTargets=None):
+    self._p = pybullet_client
+    self.bodyUid = bodyUid
+    self.motorTargets = motorTargets
+    self.numTicks = numTicks
+    self.tracks = tracks
+    self.profiler = profiler
+
+  #returns the number of physics steps taken
+  def run(self, stopWhen=None, checkEvery=1):
+    ticks = self.ticks(stopWhen, checkEvery)
+    try:
+      next(ticks)
+      while True:
+        self._p.stepSimulation()
+        ticks.send(1)
+    except StopIteration as stop:
+      return stop.value
+
+  #run as a generator in the protocol of Kuka.action2Settle: it applies the tracks and yields 1 before every
+  #physics step, the caller steps the simulation
+  def ticks(self, stopWhen=None, checkEvery=1):
+    for track in self.tracks:
+      track.reset()
+    tick = 0
+    while tick < self.numTicks:
+      for track in self.tracks:
+        track.apply(self._p, self.bodyUid, self.motorTargets)
+      yield 1
+      tick += 1
+      if stopWhen is not None and tick % checkEvery == 0 and stopWhen():
+        break
+    self.profiler.count('stepSimulation', tick)
+    return tick
+
+class StableOutcome(object):
+  #stopWhen for ScriptedPhase.run: True once success, or failure, has held for numChecks checks in a row.
+  #success None only stops on failure.
+  def __init__(self, success, failure, numChecks):
+    self.success = success
+    self.failure = failure
+    self.numChecks = numChecks
+    self.outcome = None
+    self.count = 0
+
+  def __call__(self):
+    if self.success is not None and self.success():
+      outcome = True
+    elif self.failure():
+      outcome = False
+    else:
+      outcome = None
+    if outcome is None or outcome != self.outcome:
+      self.count = 0
+    self.outcome = outcome
+    if outcome is not None:
+      self.count += 1
+    return self.count >= self.numChecks
+
+#the two fingers of the gripper at -fingerAngle and fingerAngle, the finger tips held straight, with the
+#forces and gains of kuka. fingerAngle is called once per tick.
+def gripperTracks(kuka, fingerAngle):
+  def fingerTargets():
+    angle = fingerAngle()
+    return (-angle, angle)
+  return [
+      JointTrack([8, 11], fingerTargets, [kuka.fingerAForce, kuka.fingerBForce], \
+              positionGains=list(kuka._positionGains[:2]), velocityGains=list(kuka._velocityGains[:2])),
+      JointTrack([10, 13], [0, 0], [kuka.fingerTipForce]*2, \
+              positionGains=list(kuka._positionGains[:2]), velocityGains=list(kuka._velocityGains[:2])),
+  ]
@@ -0,0 +1,95 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+class StartStateCache(object):
+  #Keeps settled start states of one physics client as in-memory snapshots with LRU eviction,
+  #optionally backed by .bullet files in directory so that other envs and later runs can reuse them.
+  #A state is saved with a dict of what the env keeps outside of the simulation, e.g. the end effector target the
+  #settle left, restore returns it. In directory it is a .json file next to the .bullet file.
+  def __init__(self, pybullet_client, maxSize=64, directory=None):
+    self._p = pybullet_client
+    self.maxSize = maxSize
+    self.directory = directory
+    self._stateIds = OrderedDict()
+    self._extras = {}
+    self.hits = 0
+    self.misses = 0
+    if self.directory is not None:
+      os.makedirs(self.directory, exist_ok=True)
+
+  #config holds what else the settled state depends on, e.g. the body set and the physics settings of the env
+  @staticmethod
+  def makeKey(envName, jointPos, objectPose=None, config=()):
+    jointPos = tuple(float(x) for x in jointPos)
+    if objectPose is not None:
+      objectPose = tuple(tuple(float(x) for x in part) for part in objectPose)
+    return (envName, tuple(config), jointPos, objectPose)
+
+  def _fileName(self, key, ext='.bullet'):
+    return os.path.join(self.directory, hashlib.sha1(repr(key).encode()).hexdigest()+ext)
+
+  #restore the state stored under key and return the dict it was saved with, None if there is none
+  def restore(self, key):
+    stateId = self._stateIds.get(key)
+    if stateId is not None:
+      self._stateIds.move_to_end(key)
+      self._p.restoreState(stateId=stateId)
+      self.hits += 1
+      return self._extras[key]
+    if self.directory is not None and os.path.isfile(self._fileName(key)) and os.path.isfile(self._fileName(key, '.json')):
+      with open(self._fileName(key, '.json')) as f:
+        extra = json.load(f)
+      self._p.restoreState(fileName=self._fileName(key))
+      self._add(key, extra)
+      self.hits += 1
+      return extra
+    self.misses += 1
+    return None
+
+  #extra holds JSON types only. The env goes on from the state as a hit restores it, restoreState recomputes the link
+  #frames pybullet keeps from before the last step and a .bullet file does not keep all of a saveState snapshot, so
+  #an episode from a saved start is the same as one from a hit.
+  def save(self, key, extra=None):
+    extra = dict(extra or {})
+    if self.directory is not None:
+      if not os.path.isfile(self._fileName(key)):
+        #write to temporary files first, other processes may be reading the store. The .bullet file comes last,
+        #restore only takes a state with both files.
+        for ext, write in (('.json', lambda fileName: self._writeJSON(fileName, extra)), ('.bullet', self._p.saveBullet)):
+          fileName = self._fileName(key, ext)
+          tmpFileName = '%s.%d.tmp' % (fileName, os.getpid())
+          write(tmpFileName)
+          os.replace(tmpFileName, fileName)
+      self._p.restoreState(fileName=self._fileName(key))
+    if key not in self._stateIds:
+      self._add(key, extra)
+    if self.directory is None and key in self._stateIds:
+      self._p.restoreState(stateId=self._stateIds[key])
+
+  @staticmethod
+  def _writeJSON(fileName, extra):
+    with open(fileName, 'w') as f:
+      json.dump(extra, f)
+
+  def _add(self, key, extra):
+    if self.maxSize <= 0:
+      return
+    self._stateIds[key] = self._p.saveState()
+    self._extras[key] = extra
+    while len(self._stateIds) > self.maxSize:
+      evicted, stateId = self._stateIds.popitem(last=False)
+      del self._extras[evicted]
+      self._p.removeState(stateId)
+
+  #the in-memory snapshots do not survive resetSimulation, the files do
+  def clear(self, removeStates=True):
+    if removeStates:
+      for stateId in self._stateIds.values():
+        self._p.removeState(stateId)
+    self._stateIds.clear()
+    self._extras.clear()
+
+  def __len__(self):
+    return len(self._stateIds)
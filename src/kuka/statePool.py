@@ -0,0 +1,52 @@
+from collections import OrderedDict
+
+class StatePool(object):
+  #In-memory snapshots of one physics client together with the episode state that belongs to them,
+  #handed out as integer handles. At most maxSize snapshots are kept, the least recently used one
+  #is removed first.
+  def __init__(self, pybullet_client, maxSize=256):
+    self._p = pybullet_client
+    self.maxSize = maxSize
+    self._states = OrderedDict()
+    self._nextHandle = 0
+    self.saves = 0
+    self.restores = 0
+    self.evictions = 0
+
+  #saves the simulation, data is handed back by restore
+  def save(self, data):
+    handle = self._nextHandle
+    self._nextHandle += 1
+    self._states[handle] = (self._p.saveState(), data)
+    self.saves += 1
+    while len(self._states) > self.maxSize:
+      _, (stateId, _) = self._states.popitem(last=False)
+      self._p.removeState(stateId)
+      self.evictions += 1
+    return handle
+
+  def restore(self, handle):
+    if handle not in self._states:
+      raise KeyError('state %s was evicted or dropped by a reset' % handle)
+    self._states.move_to_end(handle)
+    stateId, data = self._states[handle]
+    self._p.restoreState(stateId=stateId)
+    self.restores += 1
+    return data
+
+  def release(self, handle):
+    stateId, _ = self._states.pop(handle)
+    self._p.removeState(stateId)
+
+  #the snapshots do not survive resetSimulation
+  def clear(self, removeStates=True):
+    if removeStates:
+      for stateId, _ in self._states.values():
+        self._p.removeState(stateId)
+    self._states.clear()
+
+  def __contains__(self, handle):
+    return handle in self._states
+
+  def __len__(self):
+    return len(self._states)
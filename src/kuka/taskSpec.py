@@ -0,0 +1,79 @@
+import pybullet as p
+from .scriptedPhase import Ramp, gripperTracks
+
+class SceneObject(object):
+  #A task object: the env attribute its uid is kept in (e.g. 'blockUid'), the asset it is loaded from and the pose
+  #the scene snapshot of fastReset loads it at. beforeKuka loads it before the arm. held places it before the arm
+  #settles, e.g. a block in the gripper, which makes its pose part of the start state cache key. scaled objects
+  #are loaded at the objectScale of the domain randomization.
+  def __init__(self, attr, asset, pos, orn=(0,0,0,1), beforeKuka=False, held=False, scaled=True):
+    self.attr = attr
+    self.asset = asset
+    self.pos = list(pos)
+    self.orn = list(orn)
+    self.beforeKuka = beforeKuka or held
+    self.held = held
+    self.scaled = scaled
+
+class TerminalMacro(object):
+  #The scripted end of an episode. Once trigger(env, eeState) is True, eeState being the end effector link state
+  #the step read, the episode terminates with gripper_closed set to gripperClosed and the tracks from
+  #tracks(env, eeState) drive the arm for numTicks steps at 240 Hz.
+  def __init__(self, trigger, tracks, gripperClosed, numTicks=1000):
+    self.trigger = trigger
+    self.tracks = tracks
+    self.gripperClosed = gripperClosed
+    self.numTicks = numTicks
+
+class TaskSpec(object):
+  #What makes a Kuka task, KukaContiEnv implements reset, termination, reward and the observation from it once for
+  #all tasks, with fastReset, the start state cache, workcells and domain randomization.
+  #objects: the SceneObjects, loaded in this order
+  #sample(env, **kwargs): draws an episode from env.np_random, returns attr -> (pos, orn) of every object and the
+  #  gripperInitOrn of Kuka, None keeps it. kwargs are the keyword arguments of reset besides finalJPos and seed.
+  #jointInitPos: the finalJPos of reset. With fingerPos finalJPos holds the arm joints only and fingerPos is appended.
+  #target: (attr, link) of the object the observation is relative to, link None is the base
+  #distance: the two (attr, link) whose closest points internalReward measures, attr 'kuka' is the arm, link 'ee' its
+  #  end effector and None the whole body
+  #goal(env): the episode has terminated in its goal, rewarded with 1
+  #success(env), failure(env): the outcome of the terminal phase, see KukaContiEnv.success. success defaults to goal.
+  def __init__(self, objects, sample, jointInitPos, target, distance, terminal, goal, success=None, failure=None, \
+               fingerPos=None, tray=True, kukaParams=None, gripperClosed=0, maxSteps=10):
+    self.objects = list(objects)
+    self.sample = sample
+    self.jointInitPos = list(jointInitPos)
+    self.fingerPos = fingerPos
+    self.target = target
+    self.distance = distance
+    self.terminal = terminal
+    self.goal = goal
+    self.success = success if success is not None else goal
+    self.failure = failure
+    self.tray = tray
+    self.kukaParams = kukaParams if kukaParams is not None else {}
+    self.gripperClosed = gripperClosed
+    self.maxSteps = maxSteps
+
+  #the AssetRegistry names the task loads
+  @property
+  def assetNames(self):
+    names = ['plane', 'table'] + (['tray'] if self.tray else []) + ['kuka']
+    for obj in self.objects:
+      if obj.asset not in names:
+        names.append(obj.asset)
+    return tuple(names)
+
+#quaternion of a rotation by ang about z, as a list
+def yaw(ang):
+  return list(p.getQuaternionFromEuler([0,0,ang]))
+
+#trigger of a terminal macro: the end effector has come down to z
+def endEffectorBelow(z):
+  return lambda env, eeState: eeState[0][2] <= z
+
+#finger tracks of a terminal macro, closing the gripper in 100 steps at 240 Hz or opening it in 1000
+def closeGripper(env):
+  return gripperTracks(env._kuka, Ramp(0.3, -(0.3/100.)*env._tickScale, 0))
+
+def openGripper(env):
+  return gripperTracks(env._kuka, Ramp(0, (0.03/100.)*env._tickScale, 0.3))
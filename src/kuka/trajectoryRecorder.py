@@ -0,0 +1,208 @@
+import os
+import numpy as np
+
+#column dtypes, obs and actions are stored in single precision, the joint positions and the extra pose
+#in double precision, setGoodInitState gets them back as they were recorded
+DTYPES = {
+    'obs': np.float32,
+    'nextObs': np.float32,
+    'action': np.float32,
+    'reward': np.float32,
+    'done': np.bool_,
+    'episode': np.int32,
+    'jointPos': np.float64,
+    'extra': np.float64,
+}
+
+def _shardNames(directory):
+  return sorted(name for name in os.listdir(directory) if name.startswith('shard_'))
+
+class TrajectoryRecorder(object):
+  #Wraps a KukaContiEnv and records every step as a row (obs, action, reward, done, nextObs) together
+  #with the arm joint positions and getExtraInfo of obs, which setGoodInitState needs to restore the state.
+  #Rows are collected in preallocated arrays of chunkSize rows, every full chunk is written to directory
+  #as a new shard: a directory with one .npy file per column. Shards are never rewritten, recording into
+  #a directory that already has shards appends to it.
+  def __init__(self, env, directory, chunkSize=10000):
+    self.env = env
+    self.directory = directory
+    self.chunkSize = chunkSize
+    os.makedirs(directory, exist_ok=True)
+    shards = _shardNames(directory)
+    self._nextShard = int(shards[-1].split('_')[1])+1 if shards else 0
+    self._episode = -1
+    if shards:
+      self._episode = int(np.load(os.path.join(directory, shards[-1], 'episode.npy'), mmap_mode='r')[-1])
+    self._columns = None
+    self._numRows = 0
+
+  def __getattr__(self, name):
+    return getattr(self.env, name)
+
+  def reset(self, **kwargs):
+    ob = self.env.reset(**kwargs)
+    self._startEpisode(ob)
+    return ob
+
+  #the curriculum starts and restoreState begin a new episode as reset does
+  def getGoodInitState(self):
+    ob, jointPos = self.env.getGoodInitState()
+    self._startEpisode(ob)
+    return ob, jointPos
+
+  def getMidInitState(self):
+    ob = self.env.getMidInitState()
+    self._startEpisode(ob)
+    return ob
+
+  def getGoodMidInitState(self):
+    ob = self.env.getGoodMidInitState()
+    self._startEpisode(ob)
+    return ob
+
+  #setGoodInitState of KukaContiOpenDoorEnv returns nothing, the start is the observation it leaves
+  def setGoodInitState(self, ob, jointPoses, extra=None):
+    result = self.env.setGoodInitState(ob, jointPoses, extra)
+    self._startEpisode(self.env._observation)
+    return result
+
+  def restoreState(self, handle):
+    ob = self.env.restoreState(handle)
+    self._startEpisode(ob)
+    return ob
+
+  def _startEpisode(self, ob):
+    self._episode += 1
+    self._capture(ob)
+
+  def step(self, action):
+    return self._record(self.env.step, action)
+
+  def step2(self, action):
+    return self._record(self.env.step2, action)
+
+  def stepPosDiff(self, action):
+    return self._record(self.env.stepPosDiff, action)
+
+  #the state obs was observed in, the buffer may be handed out by the env, so obs is copied
+  def _capture(self, ob):
+    self._ob = np.array(ob, dtype=np.float32)
+    self._jointPos = self.env.getCurrentJointPos()
+    extra = self.env.getExtraInfo()
+    self._extra = None if extra is None else np.concatenate([np.ravel(part) for part in extra])
+
+  def _allocate(self, action):
+    shapes = {
+        'obs': self._ob.shape,
+        'nextObs': self._ob.shape,
+        'action': np.shape(action),
+        'reward': (),
+        'done': (),
+        'episode': (),
+        'jointPos': (len(self._jointPos),),
+    }
+    if self._extra is not None:
+      shapes['extra'] = self._extra.shape
+    self._columns = dict((name, np.zeros((self.chunkSize,)+shape, dtype=DTYPES[name])) for name, shape in shapes.items())
+
+  def _record(self, stepFn, action):
+    ob, reward, done, info = stepFn(action)
+    if self._columns is None:
+      self._allocate(action)
+    i = self._numRows
+    columns = self._columns
+    columns['obs'][i] = self._ob
+    columns['nextObs'][i] = ob
+    columns['action'][i] = action
+    columns['reward'][i] = reward
+    columns['done'][i] = done
+    columns['episode'][i] = self._episode
+    columns['jointPos'][i] = self._jointPos
+    if 'extra' in columns:
+      columns['extra'][i] = self._extra
+    self._numRows += 1
+    if self._numRows == self.chunkSize:
+      self.flush()
+    self._capture(ob)
+    return ob, reward, done, info
+
+  #writes the rows recorded so far as a new shard, the shard only appears once all its columns are written
+  def flush(self):
+    if self._numRows == 0:
+      return
+    name = 'shard_%06d' % self._nextShard
+    tmpPath = os.path.join(self.directory, '.%s.tmp' % name)
+    os.makedirs(tmpPath)
+    for column, values in self._columns.items():
+      np.save(os.path.join(tmpPath, column+'.npy'), values[:self._numRows])
+    os.replace(tmpPath, os.path.join(self.directory, name))
+    self._nextShard += 1
+    self._numRows = 0
+
+  def close(self):
+    self.flush()
+    self.env.close()
+
+class TrajectoryReader(object):
+  #Memory maps the shards written by TrajectoryRecorder, rows are numbered across all shards.
+  #Rows read from one shard are views of the file, sample only copies the sampled rows.
+  def __init__(self, directory):
+    self.directory = directory
+    self.shards = []
+    for name in _shardNames(directory):
+      path = os.path.join(directory, name)
+      self.shards.append(dict((fileName[:-4], np.load(os.path.join(path, fileName), mmap_mode='r')) \
+              for fileName in os.listdir(path) if fileName.endswith('.npy')))
+    sizes = [len(shard['done']) for shard in self.shards]
+    self._offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+
+  def __len__(self):
+    return int(self._offsets[-1])
+
+  @property
+  def columns(self):
+    return sorted(self.shards[0]) if self.shards else []
+
+  #column values of the rows in [start, stop), a view if they are in one shard
+  def read(self, column, start=0, stop=None):
+    stop = len(self) if stop is None else stop
+    parts = []
+    for shard, offset in zip(self.shards, self._offsets[:-1]):
+      values = shard[column]
+      lo, hi = max(start-offset, 0), min(stop-offset, len(values))
+      if lo < hi:
+        parts.append(values[lo:hi])
+    if len(parts) == 1:
+      return parts[0]
+    return np.concatenate(parts) if parts else np.zeros((0,)+self.shards[0][column].shape[1:], self.shards[0][column].dtype)
+
+  #column values of the rows in indices, one gather per shard
+  def get(self, column, indices):
+    indices = np.asarray(indices)
+    shardIndices = np.searchsorted(self._offsets, indices, side='right')-1
+    out = np.empty((len(indices),)+self.shards[0][column].shape[1:], dtype=self.shards[0][column].dtype)
+    for s in np.unique(shardIndices):
+      mask = shardIndices == s
+      out[mask] = self.shards[s][column][indices[mask]-self._offsets[s]]
+    return out
+
+  #a batch of random rows as a dict of columns. rng is a seed, a np.random.Generator such as env.np_random or a
+  #RandomState, by default the rows are drawn from np.random.
+  def sample(self, batchSize, rng=np.random):
+    if isinstance(rng, (int, np.integer)):
+      rng = np.random.default_rng(rng)
+    draw = rng.integers if isinstance(rng, np.random.Generator) else rng.randint
+    indices = np.sort(draw(0, len(self), size=batchSize))
+    return dict((column, self.get(column, indices)) for column in self.columns)
+
+  #puts env into the state row index was recorded in, with the env's setGoodInitState
+  def restore(self, env, index):
+    ob = self.get('obs', [index])[0]
+    jointPos = self.get('jointPos', [index])[0].tolist()
+    extra = None
+    if 'extra' in self.columns:
+      #getExtraInfo is a pose: position and orientation quaternion
+      pose = self.get('extra', [index])[0]
+      extra = [pose[:3].tolist(), pose[3:].tolist()]
+    env.setGoodInitState(ob, jointPos, extra)
+    return np.array(env.getExtendedObservation())